@@ -0,0 +1,287 @@
+"""BLE-CAN adapter protocol: request frame builders (CAN config 0xFF, UDS flow
+control 0xFE, UDS payload), the config acknowledgments, and the cache of what
+each adapter last acknowledged.
+"""
+import json
+import os
+
+ADDRESS = "38:3B:26:A2:27:FC"
+WRITE_UUID = "0000FFF2-0000-1000-8000-00805F9B34FB"
+NOTIFY_UUID = "0000FFF1-0000-1000-8000-00805F9B34FB"
+
+RESPONSE_TIMEOUT_MS = 3000
+
+# Expected configuration acknowledgments
+RECONFIG_DONE = bytes([0x55, 0xA9, 0x00, 0x01, 0xFF, 0x00])
+FLOWCONTROL_DONE = bytes([0x55, 0xA9, 0x00, 0x01, 0xFE, 0x00])
+
+# Last configuration acknowledged by each adapter, kept between runs
+CONFIG_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".linkobd_adapter_config.json")
+
+def calculate_crc8(data):
+    """Calculate CRC8 with polynomial 0x1F (BLE-CAN protocol)"""
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            if crc & 0x80:
+                crc = (crc << 1) ^ 0x1F
+            else:
+                crc <<= 1
+            crc &= 0xFF
+    return crc
+
+def create_can_config_frame(can_channel=0, baudrate=500, diag_can_id=0x000007FF,
+                            diag_req_can_id=0x00000710, filter_mask=0xFFFFFFFF):
+    """Create CAN configuration frame (0xFF command)"""
+    frame = [
+        0xAA, 0xA6,  # Header
+        0xFF,        # CAN config command
+        0x00, 0x10,  # Length = 16 bytes
+        0x10 | (can_channel & 0x0F),  # filterCount=1, canChannel
+        (baudrate >> 8) & 0xFF, baudrate & 0xFF,  # baudrate in kbit/s (500 = 0x01F4)
+    ]
+    # diagReqCanId (request ID) first, then diagCanId (response ID) and filterMask,
+    # each 32-bit big-endian, in the order of BleCanProtocol.createCanConfigFrame in the app
+    frame.extend(diag_req_can_id.to_bytes(4, 'big'))
+    frame.extend(diag_can_id.to_bytes(4, 'big'))
+    frame.extend(filter_mask.to_bytes(4, 'big'))
+    
+    # Add CRC8
+    crc_data = frame[2:]  # Skip header
+    crc = calculate_crc8(crc_data)
+    frame.append(crc)
+    
+    return bytes(frame)
+
+def create_uds_flow_control_frame(uds_request_enable=1, reply_flow_control=1, block_size=0x0F,
+                                  st_min=0x05, pad_value=0x55):
+    """Create UDS Flow Control configuration frame (0xFE command)"""
+    frame = [
+        0xAA, 0xA6,  # Header
+        0xFE,        # UDS flow control command
+        0x00, 0x04,  # Length = 4 bytes
+        ((uds_request_enable & 0x0F) << 4) | (reply_flow_control & 0x0F),  # udsRequestEnable, replyFlowControl
+        block_size & 0xFF,  # blockSize (default 15)
+        st_min & 0xFF,      # stMin in ms (default 5)
+        pad_value & 0xFF,   # padValue (default 0x55)
+    ]
+    
+    # Add CRC8
+    crc_data = frame[2:]  # Skip header
+    crc = calculate_crc8(crc_data)
+    frame.append(crc)
+    
+    return bytes(frame)
+
+def create_uds_payload_frame(payload):
+    """Create UDS payload frame in BLE-CAN protocol format"""
+    is_large = len(payload) >= 128
+    cmd_type = 0x01 if is_large else 0x00  # 0x01 for large, 0x00 for small
+    
+    frame = [
+        0xAA, 0xA6,  # Header
+        cmd_type,    # Command type
+        (len(payload) >> 8) & 0xFF,  # Length high byte
+        len(payload) & 0xFF,         # Length low byte
+    ]
+    
+    frame.extend(payload)  # Add payload
+    
+    # Calculate CRC8 over everything except the header
+    crc_data = frame[2:]  # Skip AA A6 header
+    crc = calculate_crc8(crc_data)
+    frame.append(crc)
+    
+    return bytes(frame)
+
+def parse_config_frame(frame: bytes):
+    """(kind, settings) for a 0xFF/0xFE frame the builders above can reproduce, else None"""
+    if len(frame) < 6 or frame[:2] != b'\xAA\xA6':
+        return None
+    data = frame[5:-1]
+    # The CAN config frame declares 16 bytes but carries 15, as the app's does
+    if frame[2] == 0xFF and len(data) == 15 and data[0] >> 4 == 1:
+        return "can", {
+            "can_channel": data[0] & 0x0F,
+            "baudrate": int.from_bytes(data[1:3], 'big'),
+            "diag_can_id": int.from_bytes(data[7:11], 'big'),
+            "diag_req_can_id": int.from_bytes(data[3:7], 'big'),
+            "filter_mask": int.from_bytes(data[11:15], 'big'),
+        }
+    if frame[2] == 0xFE and len(data) == 4:
+        return "flow_control", {
+            "uds_request_enable": data[0] >> 4,
+            "reply_flow_control": data[0] & 0x0F,
+            "block_size": data[1],
+            "st_min": data[2],
+            "pad_value": data[3],
+        }
+    return None
+
+class AdapterConfig:
+    """CAN (0xFF) and UDS flow control (0xFE) settings of the adapter"""
+
+    def __init__(self, can_channel=0, baudrate=500, diag_can_id=0x000007FF, diag_req_can_id=0x00000710,
+                 filter_mask=0xFFFFFFFF, uds_request_enable=1, reply_flow_control=1, block_size=0x0F,
+                 st_min=0x05, pad_value=0x55):
+        self.can = {
+            "can_channel": can_channel,
+            "baudrate": baudrate,
+            "diag_can_id": diag_can_id,
+            "diag_req_can_id": diag_req_can_id,
+            "filter_mask": filter_mask,
+        }
+        self.flow_control = {
+            "uds_request_enable": uds_request_enable,
+            "reply_flow_control": reply_flow_control,
+            "block_size": block_size,
+            "st_min": st_min,
+            "pad_value": pad_value,
+        }
+
+    def steps(self):
+        """(kind, settings, frame, expected ack) for each config command, in send order"""
+        return [
+            ("can", self.can, create_can_config_frame(**self.can), RECONFIG_DONE),
+            ("flow_control", self.flow_control, create_uds_flow_control_frame(**self.flow_control), FLOWCONTROL_DONE),
+        ]
+
+
+class AdapterConfigCache:
+    """Configuration each adapter has acknowledged, keyed by device address"""
+
+    def __init__(self, path: str = CONFIG_CACHE_PATH):
+        self.path = path
+        self._devices = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self._devices = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Ignoring unreadable config cache {path}: {e}")
+
+    def is_current(self, address: str, kind: str, settings: dict) -> bool:
+        return self._devices.get(address.upper(), {}).get(kind) == settings
+
+    def record(self, address: str, kind: str, settings: dict):
+        self._devices.setdefault(address.upper(), {})[kind] = dict(settings)
+        self._save()
+
+    def invalidate(self, address: str):
+        if self._devices.pop(address.upper(), None) is not None:
+            self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(self._devices, f, indent=2)
+        except OSError as e:
+            print(f"⚠️ Could not save config cache {self.path}: {e}")
+
+class AdapterConfigState:
+    """What one connected adapter is configured with.
+
+    Settings acknowledged on this connection are trusted. Settings skipped only
+    because the on-disk cache lists them are assumed until confirm() is called
+    on the first response, since the adapter may have been power cycled since.
+    """
+
+    def __init__(self, address: str, cache: AdapterConfigCache = None):
+        self.address = address
+        self.cache = cache if cache is not None else AdapterConfigCache()
+        self._acknowledged = {}
+        self._assumed = {}
+
+    @property
+    def assumed(self) -> bool:
+        """True while part of the configuration was skipped on the cache's word alone"""
+        return bool(self._assumed)
+
+    def steps_to_send(self, config: AdapterConfig, force: bool = False) -> list:
+        """The config.steps() entries whose settings the adapter may not have yet"""
+        steps = []
+        for kind, settings, frame, expected_ack in config.steps():
+            if not force:
+                if self._acknowledged.get(kind) == settings:
+                    continue
+                if self.cache.is_current(self.address, kind, settings):
+                    self._assumed[kind] = dict(settings)
+                    continue
+            steps.append((kind, settings, frame, expected_ack))
+        return steps
+
+    def acknowledged(self, kind: str, settings: dict):
+        self._acknowledged[kind] = dict(settings)
+        self._assumed.pop(kind, None)
+        self.cache.record(self.address, kind, settings)
+
+    def confirm(self):
+        """The adapter answered a request, so the assumed settings really are in effect"""
+        self._acknowledged.update(self._assumed)
+        self._assumed.clear()
+
+    def reset(self):
+        """Forget everything learnt on the current connection (new connection)"""
+        self._acknowledged.clear()
+        self._assumed.clear()
+
+    def invalidate(self):
+        """Forget what the adapter is configured with, here and in the on-disk cache"""
+        self.reset()
+        self.cache.invalidate(self.address)
+
+
+async def retry_with_fresh_config(state: AdapterConfigState, attempt, reconfigure):
+    """Run attempt(); if it got no answer while part of the configuration was only
+    assumed from the cache, configure the adapter for real and run it once more.
+
+    attempt() returns a falsy value when no response arrived; reconfigure()
+    sends the configuration after the state has been invalidated.
+    """
+    result = await attempt()
+    if not result and state.assumed:
+        print("⚠️ No response with cached adapter configuration, reconfiguring...")
+        state.invalidate()
+        await reconfigure()
+        result = await attempt()
+    return result
+
+
+async def configure_adapter(client, engine, state: AdapterConfigState, config: AdapterConfig, force=False):
+    """Send only the config frames whose settings the adapter may not have yet.
+
+    All needed frames are written back to back and their acks awaited together,
+    so readiness is signalled by the acks rather than fixed delays.
+    Returns the number of frames sent, or None if a frame was not acknowledged.
+    """
+    steps = state.steps_to_send(config, force)
+    if len(steps) < len(config.steps()):
+        print(f"⏭️ {len(config.steps()) - len(steps)} configuration step(s) unchanged, skipping")
+    pending = []
+    for kind, settings, frame, expected_ack in steps:
+        print(f"\n📤 Sending {kind} configuration...")
+        print(f"   Frame: {frame.hex(' ').upper()}")
+        # Register before writing so an ack that arrives immediately is not missed
+        ack = engine.expect(expected_ack)
+        try:
+            await client.write_gatt_char(WRITE_UUID, frame, response=True)
+        except Exception as e:
+            print(f"❌ {kind} config failed: {e}")
+            engine.cancel(ack, *(f for _, _, f in pending))
+            state.invalidate()
+            return None
+        pending.append((kind, settings, ack))
+
+    for kind, settings, ack in pending:
+        print(f"⏳ Waiting for {kind} acknowledgment...")
+        if await engine.wait(ack, 5000) is None:
+            print(f"❌ {kind} configuration failed - no acknowledgment received")
+            engine.cancel(*(f for _, _, f in pending))
+            state.invalidate()
+            return None
+        print(f"✅ {kind} configuration confirmed!")
+        state.acknowledged(kind, settings)
+    return len(pending)
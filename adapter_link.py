@@ -0,0 +1,213 @@
+import asyncio
+from bleak import BleakClient
+
+from adapter_config import (
+    ADDRESS, WRITE_UUID, NOTIFY_UUID, RESPONSE_TIMEOUT_MS, AdapterConfig, AdapterConfigCache,
+    AdapterConfigState, create_uds_payload_frame, retry_with_fresh_config,
+)
+from diag_session import is_response_to
+from response_matcher import ResponseFrameReassembler
+
+REQUEST_HEADER = b'\xAA\xA6'
+
+# Request commands that change adapter configuration
+CAN_CONFIG_COMMAND = 0xFF
+FLOW_CONTROL_COMMAND = 0xFE
+CONFIG_COMMANDS = {CAN_CONFIG_COMMAND, FLOW_CONTROL_COMMAND}
+
+# UDS negative response code "request correctly received - response pending"
+NRC_RESPONSE_PENDING = 0x78
+
+
+def split_request_frames(buffer: bytearray) -> list:
+    """Cut complete AA A6 request frames off the front of a client stream buffer"""
+    frames = []
+    pos = 0
+    view = memoryview(buffer)
+    try:
+        while True:
+            start = buffer.find(REQUEST_HEADER, pos)
+            if start < 0:
+                pos = len(buffer) - 1 if buffer.endswith(b'\xAA') else len(buffer)
+                break
+            if len(buffer) - start < 5:
+                pos = start
+                break
+            # Header(2) + command(1) + length(2, big-endian) + payload + CRC(1)
+            total_len = 5 + ((buffer[start + 3] << 8) | buffer[start + 4]) + 1
+            if buffer[start + 2] == CAN_CONFIG_COMMAND:
+                # The CAN config frame declares 16 bytes but carries 15 (see create_can_config_frame)
+                total_len -= 1
+            if len(buffer) - start < total_len:
+                pos = start
+                break
+            frames.append(bytes(view[start:start + total_len]))
+            pos = start + total_len
+    finally:
+        view.release()
+    if pos:
+        del buffer[:pos]
+    return frames
+
+
+def is_response_pending(frame: bytes) -> bool:
+    """True for a 7F xx 78 (response pending) frame that precedes the real answer"""
+    return len(frame) >= 8 and frame[4] == 0x7F and frame[6] == NRC_RESPONSE_PENDING
+
+
+class BleAdapterLink:
+    """Single BLE connection to the OBD adapter with one request in flight at a time"""
+
+    def __init__(self, address: str = ADDRESS, write_uuid: str = WRITE_UUID, notify_uuid: str = NOTIFY_UUID,
+                 cache: AdapterConfigCache = None):
+        self.address = address
+        self.write_uuid = write_uuid
+        self.notify_uuid = notify_uuid
+        self.config_state = AdapterConfigState(address, cache)
+        self._client = None
+        self._frames = asyncio.Queue()
+        self._reassembler = ResponseFrameReassembler()
+        self._lock = asyncio.Lock()
+
+    @property
+    def is_connected(self) -> bool:
+        return self._client is not None and self._client.is_connected
+
+    def _handle_notify(self, sender, data):
+        for frame in self._reassembler.feed(data):
+            self._frames.put_nowait(frame)
+
+    async def open(self):
+        print(f"🔌 Connecting to adapter {self.address}...")
+        self._client = BleakClient(self.address)
+        await self._client.connect()
+        await self._client.start_notify(self.notify_uuid, self._handle_notify)
+        self.config_state.reset()
+        print("✅ Adapter connected, notifications enabled")
+
+    async def close(self):
+        if self._client is None:
+            return
+        try:
+            if self._client.is_connected:
+                await self._client.stop_notify(self.notify_uuid)
+            await self._client.disconnect()
+        finally:
+            self._client = None
+            self._reassembler.clear()
+            self.config_state.reset()
+            print("🔚 Adapter disconnected")
+
+    async def write(self, frame: bytes):
+        await self._client.write_gatt_char(self.write_uuid, frame, response=True)
+
+    def _drain_stale_frames(self):
+        while not self._frames.empty():
+            stale = self._frames.get_nowait()
+            print(f"⚠️ Dropping unsolicited frame: {stale.hex(' ').upper()}")
+
+    async def request(self, frame: bytes, timeout_ms: int = RESPONSE_TIMEOUT_MS):
+        """Send one request frame and return its complete response frame (or None on timeout)"""
+        if len(frame) > 2 and frame[2] in CONFIG_COMMANDS:
+            # A raw config frame bypasses configure(), so nothing known about the adapter holds
+            self.config_state.invalidate()
+        response = await self._exchange(frame, timeout_ms)
+        if response is not None:
+            self.config_state.confirm()
+        return response
+
+    async def configured_request(self, config: AdapterConfig, frame: bytes, timeout_ms: int = RESPONSE_TIMEOUT_MS):
+        """Apply config (no round trip when already in effect), then send one request frame.
+
+        Retries once after a real reconfiguration when there was no answer while
+        part of the configuration was only assumed from the on-disk cache.
+        """
+        await self.configure(config)
+        return await retry_with_fresh_config(
+            self.config_state, lambda: self.request(frame, timeout_ms), lambda: self.configure(config))
+
+    async def _exchange(self, frame: bytes, timeout_ms: int):
+        async with self._lock:
+            self._drain_stale_frames()
+            await self.write(frame)
+            deadline = asyncio.get_running_loop().time() + timeout_ms / 1000
+            while True:
+                remaining = deadline - asyncio.get_running_loop().time()
+                if remaining <= 0:
+                    return None
+                try:
+                    response = await asyncio.wait_for(self._frames.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    return None
+                if frame[2] not in CONFIG_COMMANDS and not is_response_to(frame[5:-1], response[4:-1]):
+                    # Late answer to an earlier request (possibly another bridge client's)
+                    print(f"⚠️ Dropping stale frame: {response.hex(' ').upper()}")
+                    continue
+                if is_response_pending(response):
+                    # ECU asked for more time: restart the response timer
+                    deadline = asyncio.get_running_loop().time() + timeout_ms / 1000
+                    continue
+                return response
+
+    async def configure(self, config: AdapterConfig, force: bool = False) -> int:
+        """Send only the config frames that differ from the adapter's acknowledged state.
+
+        Settings found only in the on-disk cache are skipped but stay assumed
+        (see AdapterConfigState) until a response confirms them.
+        Returns the number of frames sent; raises ConnectionError when one is not acknowledged.
+        """
+        steps = self.config_state.steps_to_send(config, force)
+        for kind, settings, frame, expected_ack in steps:
+            response = await self._exchange(frame, RESPONSE_TIMEOUT_MS)
+            if response != expected_ack:
+                self.config_state.invalidate()
+                raise ConnectionError(f"Adapter did not acknowledge {kind} configuration")
+            self.config_state.acknowledged(kind, settings)
+        return len(steps)
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+class BleUdsTransport:
+    """UDS request/response over the BLE adapter (see diag_session.py for the interface)"""
+
+    def __init__(self, link: BleAdapterLink):
+        self.link = link
+        self.config = AdapterConfig()
+
+    async def open(self):
+        if not self.link.is_connected:
+            await self.link.open()
+
+    async def close(self):
+        await self.link.close()
+
+    async def select_ecu(self, ecu):
+        """Point the adapter's CAN request/response IDs and filter mask at the given ECU.
+
+        Also applies the flow control settings on first use. Costs no round
+        trip when the adapter is already configured the same way.
+        """
+        self.config.can["diag_req_can_id"] = ecu.can_req_id
+        self.config.can["diag_can_id"] = ecu.can_resp_id
+        self.config.can["filter_mask"] = ecu.filter_mask
+        await self.link.configure(self.config)
+
+    async def uds_request(self, payload: bytes, timeout_ms: int = RESPONSE_TIMEOUT_MS):
+        response = await self.link.configured_request(self.config, create_uds_payload_frame(payload), timeout_ms)
+        if response is None:
+            return None
+        # Strip header, DLC and CRC
+        return response[4:-1]
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
@@ -0,0 +1,82 @@
+"""Compare DoIP and BLE throughput on the same identification + DTC sweep.
+
+DoIP runs against the local stand-in server unless --doip-host is given.
+BLE only runs when --ble-address is given, since it needs the real adapter.
+"""
+import argparse
+import asyncio
+import time
+
+from diag_session import sweep
+from doip_server import DoIPStandInServer
+from doip_transport import DoIPTransport, DOIP_PORT
+from ecu_list import load_ecu_list
+
+
+class CountingTransport:
+    """Wrap a transport and count requests and response bytes"""
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.requests = 0
+        self.response_bytes = 0
+
+    async def select_ecu(self, ecu):
+        await self.transport.select_ecu(ecu)
+
+    async def uds_request(self, payload: bytes, timeout_ms: int = 3000):
+        response = await self.transport.uds_request(payload, timeout_ms)
+        self.requests += 1
+        if response is not None:
+            self.response_bytes += len(response)
+        return response
+
+
+async def run_workload(name: str, transport, ecus, rounds: int):
+    counter = CountingTransport(transport)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await sweep(counter, ecus)
+    elapsed = time.perf_counter() - start
+    print(f"📊 {name:5s}: {counter.requests} requests in {elapsed:.3f} s | "
+          f"{counter.requests / elapsed:.1f} req/s | {counter.response_bytes / elapsed / 1024:.1f} KiB/s")
+    return elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="DoIP vs BLE throughput benchmark")
+    parser.add_argument("--ecus", type=int, default=10, help="Number of ECUs from ECU_List to sweep")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--doip-host", help="Real DoIP entity; default is the local stand-in")
+    parser.add_argument("--doip-port", type=int, default=DOIP_PORT)
+    parser.add_argument("--ble-address", help="BLE adapter address; BLE is skipped when omitted")
+    args = parser.parse_args()
+
+    ecus = load_ecu_list()[:args.ecus]
+    print(f"🧪 Workload: identification + DTC read on {len(ecus)} ECUs x {args.rounds} rounds")
+
+    server = None
+    doip_host, doip_port = args.doip_host, args.doip_port
+    if doip_host is None:
+        server = DoIPStandInServer(load_ecu_list())
+        doip_host = "127.0.0.1"
+        doip_port = await server.start(doip_host, 0)
+    try:
+        async with DoIPTransport(doip_host, doip_port) as transport:
+            doip_elapsed = await run_workload("DoIP", transport, ecus, args.rounds)
+    finally:
+        if server is not None:
+            await server.stop()
+
+    if args.ble_address:
+        from adapter_link import BleAdapterLink, BleUdsTransport
+        async with BleUdsTransport(BleAdapterLink(args.ble_address)) as transport:
+            ble_elapsed = await run_workload("BLE", transport, ecus, args.rounds)
+        print(f"🚀 DoIP is {ble_elapsed / doip_elapsed:.1f}x faster than BLE on this workload")
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\n🛑 User interrupted, exiting")
@@ -0,0 +1,247 @@
+import argparse
+import asyncio
+import itertools
+
+from adapter_config import (
+    ADDRESS, RESPONSE_TIMEOUT_MS, RECONFIG_DONE, FLOWCONTROL_DONE, AdapterConfig, parse_config_frame,
+)
+from adapter_link import BleAdapterLink, split_request_frames
+
+DEFAULT_PORT = 35000
+DEFAULT_PRIORITY = 10        # lower value = served first
+MAX_PENDING_PER_CLIENT = 8   # requests a single client may have queued at once
+READ_CHUNK_SIZE = 4096
+UDP_CLIENT_IDLE_S = 60.0     # UDP peers silent this long are forgotten
+
+CONFIG_ACKS = {"can": RECONFIG_DONE, "flow_control": FLOWCONTROL_DONE}
+
+
+class BridgeClient:
+    """One remote TCP connection or UDP peer sharing the adapter"""
+
+    def __init__(self, name: str, priority: int, send):
+        self.name = name
+        self.priority = priority
+        self.send = send
+        self.closed = False
+        self.buffer = bytearray()
+        self.pending = 0
+        self.slot_freed = asyncio.Event()
+        self.last_seen = asyncio.get_running_loop().time()
+        # Adapter configuration this client asked for (defaults until it sends
+        # config frames); re-applied before each of its requests
+        self.config = AdapterConfig()
+
+
+class BridgeServer:
+    """Share one adapter link between many TCP/UDP clients.
+
+    Clients send complete AA A6 request frames. Requests from all clients go
+    through one priority queue (lower priority value first, FIFO within a
+    priority) and are sent to the adapter one at a time, so the matching 55 A9
+    response is always routed back to the client that issued the request.
+
+    The adapter's CAN/flow control configuration is shared, so config frames
+    are not forwarded as is: each client's settings are kept and re-applied
+    through link.configure() (a no-op when already in effect) before that
+    client's requests, and the client gets the usual ack.
+    """
+
+    def __init__(self, link, priorities: dict = None, default_priority: int = DEFAULT_PRIORITY,
+                 timeout_ms: int = RESPONSE_TIMEOUT_MS):
+        self.link = link
+        self.priorities = priorities or {}
+        self.default_priority = default_priority
+        self.timeout_ms = timeout_ms
+        self._queue = asyncio.PriorityQueue()
+        self._seq = itertools.count()
+        self._udp_clients = {}
+        self._tcp_clients = {}
+        self._servers = []
+        self._udp_transport = None
+        self._worker = None
+        self._expiry = None
+
+    def _priority_for(self, host: str) -> int:
+        return self.priorities.get(host, self.default_priority)
+
+    def _enqueue(self, client: BridgeClient, frame: bytes):
+        client.pending += 1
+        self._queue.put_nowait((client.priority, next(self._seq), client, frame))
+
+    async def submit(self, client: BridgeClient, frame: bytes):
+        """Queue one request frame on behalf of a client, waiting while it has too many pending"""
+        while client.pending >= MAX_PENDING_PER_CLIENT:
+            client.slot_freed.clear()
+            await client.slot_freed.wait()
+        self._enqueue(client, frame)
+
+    async def _arbitrate(self):
+        while True:
+            _, _, client, frame = await self._queue.get()
+            try:
+                if client.closed:
+                    continue
+                try:
+                    response = await self._forward(client, frame)
+                except Exception as e:
+                    print(f"❌ Adapter request from {client.name} failed: {e}")
+                    continue
+                if response is None:
+                    print(f"⚠️ No adapter response for {client.name}: {frame.hex(' ').upper()}")
+                    continue
+                if not client.closed:
+                    client.send(response)
+            finally:
+                client.pending -= 1
+                client.slot_freed.set()
+                self._queue.task_done()
+
+    async def _forward(self, client: BridgeClient, frame: bytes):
+        parsed = parse_config_frame(frame)
+        if parsed is not None:
+            kind, settings = parsed
+            getattr(client.config, kind).update(settings)
+            await self.link.configure(client.config)
+            return CONFIG_ACKS[kind]
+        # Another client may have pointed the adapter at a different ECU since
+        return await self.link.configured_request(client.config, frame, self.timeout_ms)
+
+    # ==== TCP ====
+    async def _handle_tcp(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        host, port = writer.get_extra_info('peername')[:2]
+        client = BridgeClient(f"tcp://{host}:{port}", self._priority_for(host), writer.write)
+        print(f"🔗 {client.name} connected (priority {client.priority})")
+        self._tcp_clients[writer] = asyncio.current_task()
+        try:
+            while True:
+                data = await reader.read(READ_CHUNK_SIZE)
+                if not data:
+                    break
+                client.buffer += data
+                for frame in split_request_frames(client.buffer):
+                    await self.submit(client, frame)
+                await writer.drain()
+        except ConnectionError as e:
+            print(f"⚠️ {client.name} connection error: {e}")
+        finally:
+            client.closed = True
+            self._tcp_clients.pop(writer, None)
+            writer.close()
+            print(f"🔚 {client.name} disconnected")
+
+    # ==== UDP ====
+    def _udp_client(self, addr) -> BridgeClient:
+        client = self._udp_clients.get(addr)
+        if client is not None:
+            client.last_seen = asyncio.get_running_loop().time()
+        else:
+            host, port = addr[:2]
+            client = BridgeClient(
+                f"udp://{host}:{port}",
+                self._priority_for(host),
+                lambda data: self._udp_transport.sendto(data, addr),
+            )
+            self._udp_clients[addr] = client
+            print(f"🔗 {client.name} registered (priority {client.priority})")
+        return client
+
+    def _handle_datagram(self, data: bytes, addr):
+        client = self._udp_client(addr)
+        client.buffer += data
+        for frame in split_request_frames(client.buffer):
+            # Counted here, synchronously, so one datagram cannot queue past the limit
+            if client.pending >= MAX_PENDING_PER_CLIENT:
+                print(f"⚠️ {client.name} has too many pending requests, dropping frame")
+                continue
+            self._enqueue(client, frame)
+
+    async def _expire_udp_clients(self):
+        while True:
+            await asyncio.sleep(UDP_CLIENT_IDLE_S / 2)
+            now = asyncio.get_running_loop().time()
+            for addr, client in list(self._udp_clients.items()):
+                if client.pending == 0 and now - client.last_seen > UDP_CLIENT_IDLE_S:
+                    client.closed = True
+                    del self._udp_clients[addr]
+                    print(f"🔚 {client.name} expired after {UDP_CLIENT_IDLE_S:.0f} s idle")
+
+    async def start(self, host: str = "0.0.0.0", tcp_port: int = DEFAULT_PORT, udp_port: int = DEFAULT_PORT):
+        loop = asyncio.get_running_loop()
+        self._worker = loop.create_task(self._arbitrate())
+        if tcp_port:
+            server = await asyncio.start_server(self._handle_tcp, host, tcp_port)
+            self._servers.append(server)
+            print(f"✅ TCP bridge listening on {host}:{tcp_port}")
+        if udp_port:
+            bridge = self
+
+            class _UdpProtocol(asyncio.DatagramProtocol):
+                def datagram_received(self, data, addr):
+                    bridge._handle_datagram(data, addr)
+
+            self._udp_transport, _ = await loop.create_datagram_endpoint(
+                _UdpProtocol, local_addr=(host, udp_port))
+            self._expiry = loop.create_task(self._expire_udp_clients())
+            print(f"✅ UDP bridge listening on {host}:{udp_port}")
+
+    async def stop(self):
+        for server in self._servers:
+            server.close()
+        # Closing the writers ends each handler's read loop, so none is left to be cancelled
+        handlers = list(self._tcp_clients.values())
+        for writer in list(self._tcp_clients):
+            writer.close()
+        await asyncio.gather(*handlers, return_exceptions=True)
+        for server in self._servers:
+            await server.wait_closed()
+        self._servers.clear()
+        if self._udp_transport is not None:
+            self._udp_transport.close()
+            self._udp_transport = None
+        for task in (self._worker, self._expiry):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._worker = self._expiry = None
+        self._udp_clients.clear()
+        print("🔚 Bridge stopped")
+
+
+def parse_priorities(values) -> dict:
+    """Parse repeated HOST=PRIORITY arguments"""
+    priorities = {}
+    for value in values or []:
+        host, _, priority = value.partition('=')
+        priorities[host] = int(priority)
+    return priorities
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Share one BLE OBD adapter with many TCP/UDP clients")
+    parser.add_argument("--address", default=ADDRESS, help="BLE address of the adapter")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--tcp-port", type=int, default=DEFAULT_PORT, help="0 disables TCP")
+    parser.add_argument("--udp-port", type=int, default=DEFAULT_PORT, help="0 disables UDP")
+    parser.add_argument("--priority", action="append", metavar="HOST=N",
+                        help="Per-client priority, lower is served first (repeatable)")
+    parser.add_argument("--timeout-ms", type=int, default=RESPONSE_TIMEOUT_MS)
+    args = parser.parse_args()
+
+    async with BleAdapterLink(args.address) as link:
+        bridge = BridgeServer(link, parse_priorities(args.priority), timeout_ms=args.timeout_ms)
+        await bridge.start(args.host, args.tcp_port, args.udp_port)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await bridge.stop()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\n🛑 User interrupted, exiting")
@@ -2,7 +2,9 @@ import asyncio
 import math
 import platform
 from binascii import unhexlify, hexlify
-from bleak import BleakClient, BleakScanner
+
+from response_matcher import ExpectationEngine
+from startup_pipeline import BondCache, pair_if_needed, start_session
 
 ADDRESS = "5C:53:10:03:76:7A"
 DEVICE_NAME = "X_BLE_OBD"
@@ -69,90 +71,42 @@ def split_into_frames(hex_str: str, frame_payload_size: int = 16):
 
     return frames
 
-# ==== BLE应答等待（用于预设帧）====
-async def wait_for_frame_with_header(notify_queue: asyncio.Queue, timeout_ms: int = 2000):
-    buffer = bytearray()
-    timeout_sec = timeout_ms / 1000
-    deadline = asyncio.get_event_loop().time() + timeout_sec
-
-    while True:
-        remaining = deadline - asyncio.get_event_loop().time()
-        if remaining <= 0:
-            print("❌ 超时未收到完整帧")
-            return None
-
-        try:
-            data = await asyncio.wait_for(notify_queue.get(), timeout=remaining)
-            buffer.extend(data)
-
-            while len(buffer) >= 4:
-                if buffer[0] != 0x55 or buffer[1] != 0xA9:
-                    buffer.pop(0)
-                    continue
-
-                dlc = (buffer[2] << 8) | buffer[3] + 1
-                total_len = 4 + dlc
-
-                if len(buffer) >= total_len:
-                    frame = buffer[:total_len]
-                    del buffer[:total_len]
-                    print(f"✅ [完整帧接收] {frame.hex(' ').upper()}")
-                    return frame
-                else:
-                    break
-        except asyncio.TimeoutError:
-            return None
-
-# ==== 等待 ACK（用于长帧）====
-async def wait_for_frame_ack(notify_queue: asyncio.Queue, expected_index: int, timeout_ms: int = 2000):
-    timeout_sec = timeout_ms / 1000
-    deadline = asyncio.get_event_loop().time() + timeout_sec
-
-    while True:
-        remaining = deadline - asyncio.get_event_loop().time()
-        if remaining <= 0:
-            print(f"❌ 超时未收到帧索引 {expected_index:02X} 的应答")
-            return False
-
-        try:
-            data = await asyncio.wait_for(notify_queue.get(), timeout=remaining)
-            if len(data) >= 4 and data[0] == 0x55 and data[1] == 0xA9 and data[2] == 0x03:
-                if data[3] == expected_index:
-                    print(f"✅ 收到 ACK 应答: 55 A9 03 {expected_index:02X}")
-                    return True
-        except asyncio.TimeoutError:
-            return False
-
 # ==== 通用帧发送器 ====
-async def send_frames_with_retry(client, notify_queue, frames, description="数据帧", use_ack=False):
+async def send_frames_with_retry(client, engine, frames, description="数据帧", use_ack=False, first_index=1):
     for i, frame in enumerate(frames):
-        frame_index = i + 1
+        frame_index = first_index + i
         retry_count = 0
         while retry_count < MAX_RETRIES:
-            # Longer delays on macOS for better reliability
-            await asyncio.sleep(0.1 + retry_count * 0.05)
+            if retry_count:
+                # 仅在重试前退避，首次发送不再固定等待
+                await asyncio.sleep(0.1 + retry_count * 0.05)
             print(f"\n📤 发送{description}第{frame_index}帧（第{retry_count+1}次尝试）: {frame.hex(' ').upper()}")
-            
+
+            # 先登记期望的应答再写入，立即到达的应答也不会丢失
+            if use_ack:
+                expected = engine.expect(bytes([0x55, 0xA9, 0x03, frame_index]))
+            else:
+                expected = engine.expect_frame()
+
             try:
                 # On macOS, use response=False to avoid issues with some devices
                 if platform.system() == "Darwin":  # macOS
                     await client.write_gatt_char(WRITE_UUID, frame, response=False)
-                    await asyncio.sleep(0.05)  # Small delay after write
                 else:
                     await client.write_gatt_char(WRITE_UUID, frame, response=True)
             except Exception as e:
                 print(f"❌ 写入失败: {e}")
+                engine.cancel(expected)
                 retry_count += 1
                 continue
 
-            if use_ack:
-                ack_ok = await wait_for_frame_ack(notify_queue, frame_index, RESPONSE_TIMEOUT_MS)
-                if ack_ok:
-                    break
-            else:
-                result = await wait_for_frame_with_header(notify_queue, RESPONSE_TIMEOUT_MS)
-                if result is not None:
-                    break
+            result = await engine.wait(expected, RESPONSE_TIMEOUT_MS)
+            if result is not None:
+                if use_ack:
+                    print(f"✅ 收到 ACK 应答: 55 A9 03 {frame_index:02X}")
+                else:
+                    print(f"✅ [完整帧接收] {result.hex(' ').upper()}")
+                break
 
             retry_count += 1
             print(f"⚠️ 未收到应答，重试中（{retry_count}/{MAX_RETRIES}）")
@@ -162,100 +116,64 @@ async def send_frames_with_retry(client, notify_queue, frames, description="数
             return False
     return True
 
-# ==== 设备发现（可选，用于更可靠的连接）====
-async def find_device():
-    print("🔍 正在扫描 BLE 设备...")
-    try:
-        devices = await BleakScanner.discover(timeout=10.0)
-        
-        target_device = None
-        for device in devices:
-            if device.address == ADDRESS or (device.name and DEVICE_NAME in device.name):
-                target_device = device
-                print(f"✅ 找到目标设备: {device.name} ({device.address})")
-                break
-        
-        if not target_device:
-            print(f"❌ 未找到设备 {DEVICE_NAME} ({ADDRESS})")
-            print("📋 发现的设备列表:")
-            for device in devices:
-                print(f"  - {device.name or 'Unknown'} ({device.address})")
-            return None
-        
-        return target_device
-    except Exception as e:
-        print(f"⚠️ 设备扫描失败: {e}")
-        return None
+
+def print_macos_hints():
+    if platform.system() == "Darwin":
+        print("💡 macOS 提示：")
+        print("   - 确保蓝牙已开启")
+        print("   - 检查系统设置 → 隐私与安全性 → 蓝牙权限")
+        print("   - 尝试重启蓝牙或重新配对设备")
 
 
 # ==== 主流程 ====
 async def main():
     print(f"🖥️ 运行平台: {platform.system()}")
-    
-    notify_queue = asyncio.Queue()
+
+    engine = ExpectationEngine()
+    first_response = engine.expect_frame()
 
     def handle_notify(sender, data):
         loop = asyncio.get_running_loop()
-        loop.call_soon_threadsafe(notify_queue.put_nowait, data)
-
-    # Try to find device first (more reliable on macOS)
-    if platform.system() == "Darwin":  # macOS
-        target_device = await find_device()
-        if target_device:
-            device_address = target_device.address
-        else:
-            print("⚠️ 扫描失败，尝试直接连接...")
-            device_address = ADDRESS
-    else:
-        device_address = ADDRESS
-
+        loop.call_soon_threadsafe(engine.feed, data)
+
+    # 已记录配对时 start_session 会跳过配对；若首帧无应答，说明配对可能已失效
+    bonds = BondCache()
+    pair_skipped = bonds.is_bonded(ADDRESS)
+
+    # macOS 上先扫描更可靠；扫描到目标即停止，不再等满整个扫描窗口
+    client, timings = await start_session(ADDRESS, handle_notify, scan=platform.system() == "Darwin",
+                                          device_name=DEVICE_NAME, bonds=bonds)
+    if client is None:
+        engine.cancel(first_response)
+        print_macos_hints()
+        timings.report()
+        return
+
+    first_response.add_done_callback(lambda f: f.cancelled() or timings.first_response())
     try:
-        async with BleakClient(device_address) as client:
-            print(f"🔌 正在连接 {DEVICE_NAME} ({device_address})...")
-            
-            if not client.is_connected:
-                print("❌ 连接失败")
-                return
-
-            print("✅ BLE 连接成功")
-
-            # Handle pairing differently on macOS
-            if platform.system() == "Darwin":
-                try:
-                    paired = await client.pair()
-                    print(f"配对状态: {paired}")
-                except Exception as e:
-                    print(f"⚠️ 配对跳过或失败: {e}")
-                    print("🔄 继续尝试连接...")
-            else:
-                paired = await client.pair(protection_level=2)
-                print(f"配对状态: {paired}")
-                if not paired:
-                    print("❌ 配对失败")
-                    return
-
-            await client.start_notify(NOTIFY_UUID, handle_notify)
-            await asyncio.sleep(0.5)
-            print("✅ BLE 通知监听已启动")
-
-            # 发送预设帧
-            ok = await send_frames_with_retry(client, notify_queue, FRAMES, "预设帧", use_ack=False)
-            if not ok:
-                await client.stop_notify(NOTIFY_UUID)
-                return
-
+        # 通知启用即发送预设帧，无需固定等待
+        ok = await send_frames_with_retry(client, engine, FRAMES[:1], "预设帧", use_ack=False)
+        if not ok and pair_skipped:
+            # 系统中的配对可能已被删除或适配器已重置：忘记记录的配对并重新配对
+            print("🔁 使用记录的配对无应答，重新配对...")
+            bonds.forget(ADDRESS)
+            if await pair_if_needed(client, ADDRESS, bonds):
+                ok = await send_frames_with_retry(client, engine, FRAMES[:1], "预设帧", use_ack=False)
+        if ok:
+            ok = await send_frames_with_retry(client, engine, FRAMES[1:], "预设帧", use_ack=False, first_index=2)
+        if ok:
             print("🎉 所有预设帧发送完毕")
 
-            await client.stop_notify(NOTIFY_UUID)
-            print("🔚 BLE 通信结束")
-
+        await client.stop_notify(NOTIFY_UUID)
     except Exception as e:
         print(f"❌ 连接或通信错误: {e}")
-        if platform.system() == "Darwin":
-            print("💡 macOS 提示：")
-            print("   - 确保蓝牙已开启")
-            print("   - 检查系统设置 → 隐私与安全性 → 蓝牙权限")
-            print("   - 尝试重启蓝牙或重新配对设备")
+        print_macos_hints()
+    finally:
+        engine.cancel(first_response)
+        timings.report()
+        await client.disconnect()
+        print("🔚 BLE 通信结束")
+
 # ==== 启动 ====
 if __name__ == "__main__":
     try:
@@ -0,0 +1,127 @@
+"""Transport-independent UDS diagnostics.
+
+Any transport works as long as it provides:
+
+    async open() / async close()
+    async select_ecu(ecu: EcuEntry)
+    async uds_request(payload: bytes, timeout_ms: int) -> bytes | None   # UDS response payload
+
+BleUdsTransport (adapter_link.py) and DoIPTransport (doip_transport.py) both do.
+"""
+import asyncio
+
+from ecu_list import IDENT_DIDS, HEX_IDENT_FIELDS
+
+READ_DATA_BY_IDENTIFIER = 0x22
+READ_DTC_INFORMATION = 0x19
+REPORT_DTC_BY_STATUS_MASK = 0x02
+DEFAULT_DTC_STATUS_MASK = 0xFF
+NEGATIVE_RESPONSE = 0x7F
+
+# Request bytes after the SID that a positive response echoes (sub-function, DID, RID)
+ECHOED_REQUEST_BYTES = {0x10: 1, 0x11: 1, 0x19: 1, 0x22: 2, 0x27: 1, 0x28: 1, 0x2E: 2, 0x31: 3, 0x3E: 1, 0x85: 1}
+SERVICES_WITH_SUB_FUNCTION = {0x10, 0x11, 0x19, 0x27, 0x28, 0x31, 0x3E, 0x85}
+SUPPRESS_POSITIVE_RESPONSE = 0x80
+
+# DTC status bits (ISO 14229-1)
+STATUS_TEST_FAILED = 0x01
+STATUS_TEST_FAILED_THIS_CYCLE = 0x02
+STATUS_PENDING = 0x04
+STATUS_CONFIRMED = 0x08
+STATUS_NOT_COMPLETED_SINCE_CLEAR = 0x10
+STATUS_FAILED_SINCE_CLEAR = 0x20
+STATUS_NOT_COMPLETED_THIS_CYCLE = 0x40
+STATUS_WARNING_INDICATOR = 0x80
+
+
+class Dtc:
+    """One DTC record from a 59 02 response: 3-byte code plus status byte"""
+
+    __slots__ = ("code", "status")
+
+    def __init__(self, code: int, status: int):
+        self.code = code
+        self.status = status
+
+    def __repr__(self):
+        return f"Code 0x{self.code:06X} ({self.code}) Status:0x{self.status:02X}({self.status:08b})"
+
+
+def is_response_to(request: bytes, response: bytes) -> bool:
+    """True when a UDS response answers this request rather than an earlier one"""
+    if not request or not response:
+        return False
+    sid = request[0]
+    if response[0] == NEGATIVE_RESPONSE:
+        return len(response) >= 2 and response[1] == sid
+    if response[0] != sid + 0x40:
+        return False
+    echoed = bytearray(request[1:1 + ECHOED_REQUEST_BYTES.get(sid, 0)])
+    if echoed and sid in SERVICES_WITH_SUB_FUNCTION:
+        echoed[0] &= ~SUPPRESS_POSITIVE_RESPONSE & 0xFF
+    return response[1:1 + len(echoed)] == echoed
+
+
+def decode_dtc_response(uds_data: bytes) -> list:
+    """Decode 59 02 <availability mask> followed by 4-byte DTC records (see DTC.txt)"""
+    if len(uds_data) < 3 or uds_data[0] != 0x59 or uds_data[1] != REPORT_DTC_BY_STATUS_MASK:
+        return []
+    return [
+        Dtc(int.from_bytes(uds_data[i:i + 3], "big"), uds_data[i + 3])
+        for i in range(3, len(uds_data) - 3, 4)
+    ]
+
+
+def decode_did_value(value: bytes) -> str:
+    """Render a DID value as text when printable, otherwise as hex"""
+    text = value.decode("ascii", errors="replace").strip("\x00 ")
+    if text and text.isprintable() and "�" not in text:
+        return text
+    return value.hex(" ").upper()
+
+
+async def read_did(transport, did: int, timeout_ms: int = 3000):
+    """Read one DID; returns the raw value bytes or None on timeout/negative response"""
+    response = await transport.uds_request(
+        bytes([READ_DATA_BY_IDENTIFIER, (did >> 8) & 0xFF, did & 0xFF]), timeout_ms)
+    if response is None or len(response) < 3 or response[0] != READ_DATA_BY_IDENTIFIER + 0x40:
+        return None
+    return bytes(response[3:])
+
+
+async def read_identification(transport, ecu, timeout_ms: int = 3000) -> dict:
+    """Read all identification DIDs of one ECU; returns ti_name -> display value"""
+    await transport.select_ecu(ecu)
+    values = {}
+    for did, ti_name in IDENT_DIDS.items():
+        value = await read_did(transport, did, timeout_ms)
+        if value is not None:
+            values[ti_name] = value.hex(" ").upper() if ti_name in HEX_IDENT_FIELDS else decode_did_value(value)
+    return values
+
+
+async def read_dtcs(transport, ecu, status_mask: int = DEFAULT_DTC_STATUS_MASK, timeout_ms: int = 3000) -> list:
+    """Read DTCs by status mask (19 02 xx) from one ECU"""
+    await transport.select_ecu(ecu)
+    response = await transport.uds_request(
+        bytes([READ_DTC_INFORMATION, REPORT_DTC_BY_STATUS_MASK, status_mask]), timeout_ms)
+    if response is None:
+        return []
+    return decode_dtc_response(response)
+
+
+async def sweep(transport, ecus, read_ident: bool = True, read_dtc: bool = True, timeout_ms: int = 3000) -> list:
+    """Identification and DTC read over a list of ECUs; one result dict per ECU"""
+    results = []
+    for ecu in ecus:
+        result = {"ecu": ecu}
+        try:
+            if read_ident:
+                result["ident"] = await read_identification(transport, ecu, timeout_ms)
+            if read_dtc:
+                result["dtcs"] = await read_dtcs(transport, ecu, timeout_ms=timeout_ms)
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            print(f"❌ {ecu.node} {ecu.name_en}: {e}")
+            result["error"] = str(e)
+        results.append(result)
+    return results
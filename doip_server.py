@@ -0,0 +1,149 @@
+"""Local DoIP stand-in for testing without a vehicle.
+
+Answers vehicle identification (UDP), routing activation and diagnostic
+messages (TCP) for every ECU in ECU_List, serving identification DIDs from
+the ECU_List reference values and the sample DTCs from DTC.txt.
+"""
+import argparse
+import asyncio
+import struct
+
+from doip_transport import (
+    DOIP_PORT, HEADER, VEHICLE_IDENTIFICATION_REQUEST, VEHICLE_ANNOUNCEMENT,
+    ROUTING_ACTIVATION_REQUEST, ROUTING_ACTIVATION_RESPONSE, ROUTING_ACTIVATION_SUCCESS,
+    DIAGNOSTIC_MESSAGE, DIAGNOSTIC_MESSAGE_ACK, DIAGNOSTIC_MESSAGE_NACK,
+    encode_message, encode_diagnostic_message, read_message,
+)
+from ecu_list import IDENT_DIDS, HEX_IDENT_FIELDS, load_ecu_list
+
+DEFAULT_VIN = "WAUZZZ4N0PN000001"
+GATEWAY_ADDRESS = 0x4010
+NACK_UNKNOWN_TARGET = 0x03
+
+# DTC records from DTC.txt: 3-byte code + status byte
+SAMPLE_DTCS = bytes.fromhex("D10000 2F D20000 2F D30000 2F 714101 2F 110110 2F 701101 2F 813102 2F 819104 2F")
+
+
+class SimulatedEcu:
+    """UDS responses for one ECU_List entry"""
+
+    def __init__(self, ecu, dtcs: bytes = b""):
+        self.ecu = ecu
+        self.dtcs = dtcs
+
+    def handle(self, request: bytes) -> bytes:
+        sid = request[0]
+        if sid == 0x3E:
+            return bytes([0x7E, request[1] if len(request) > 1 else 0x00])
+        if sid == 0x10 and len(request) >= 2:
+            return bytes([0x50, request[1], 0x00, 0x32, 0x01, 0xF4])
+        if sid == 0x22 and len(request) >= 3:
+            did = (request[1] << 8) | request[2]
+            ti_name = IDENT_DIDS.get(did)
+            value = self.ecu.ident.get(ti_name)
+            if value is None:
+                return bytes([0x7F, 0x22, 0x31])
+            if ti_name in HEX_IDENT_FIELDS:
+                try:
+                    return bytes([0x62, request[1], request[2]]) + bytes.fromhex(value)
+                except ValueError:
+                    return bytes([0x7F, 0x22, 0x31])
+            return bytes([0x62, request[1], request[2]]) + value.encode("utf-8")
+        if sid == 0x19 and len(request) >= 3 and request[1] == 0x02:
+            return bytes([0x59, 0x02, 0xFF]) + self.dtcs
+        return bytes([0x7F, sid, 0x11])
+
+
+class DoIPStandInServer:
+    def __init__(self, ecus, vin: str = DEFAULT_VIN, gateway_address: int = GATEWAY_ADDRESS):
+        self.vin = vin
+        self.gateway_address = gateway_address
+        self.ecus = {}
+        for index, ecu in enumerate(ecus):
+            if ecu.doip_address is not None:
+                # Only the first ECU reports stored DTCs, like the capture in DTC.txt
+                self.ecus[ecu.doip_address] = SimulatedEcu(ecu, SAMPLE_DTCS if index == 0 else b"")
+        self._tcp_server = None
+        self._udp_transport = None
+
+    def announcement(self) -> bytes:
+        payload = (self.vin.encode("ascii")[:17].ljust(17, b"0")
+                   + struct.pack(">H", self.gateway_address)
+                   + b"\x00" * 6 + b"\x00" * 6 + b"\x00")
+        return encode_message(VEHICLE_ANNOUNCEMENT, payload)
+
+    async def _handle_tcp(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        tester_address = None
+        try:
+            while True:
+                payload_type, payload = await read_message(reader)
+                if payload_type == ROUTING_ACTIVATION_REQUEST:
+                    tester_address = struct.unpack(">H", payload[:2])[0]
+                    writer.write(encode_message(ROUTING_ACTIVATION_RESPONSE, struct.pack(
+                        ">HHB4s", tester_address, self.gateway_address, ROUTING_ACTIVATION_SUCCESS, b"\x00" * 4)))
+                elif payload_type == DIAGNOSTIC_MESSAGE and tester_address is not None:
+                    source, target = struct.unpack(">HH", payload[:4])
+                    ecu = self.ecus.get(target)
+                    if ecu is None:
+                        writer.write(encode_message(DIAGNOSTIC_MESSAGE_NACK, struct.pack(
+                            ">HHB", target, source, NACK_UNKNOWN_TARGET)))
+                    else:
+                        # Positive ACK and the ECU answer go out in one write
+                        writer.write(
+                            encode_message(DIAGNOSTIC_MESSAGE_ACK, struct.pack(">HHB", target, source, 0x00))
+                            + encode_diagnostic_message(target, source, ecu.handle(payload[4:])))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = DOIP_PORT):
+        server = self
+
+        class _UdpProtocol(asyncio.DatagramProtocol):
+            def connection_made(self, transport):
+                self.transport = transport
+
+            def datagram_received(self, data, addr):
+                if len(data) >= HEADER.size and HEADER.unpack_from(data)[2] == VEHICLE_IDENTIFICATION_REQUEST:
+                    self.transport.sendto(server.announcement(), addr)
+
+        self._tcp_server = await asyncio.start_server(self._handle_tcp, host, port)
+        # Port 0 picks a free TCP port; vehicle identification uses the same number on UDP
+        port = self._tcp_server.sockets[0].getsockname()[1]
+        self._udp_transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            _UdpProtocol, local_addr=(host, port))
+        print(f"✅ DoIP stand-in listening on {host}:{port} with {len(self.ecus)} ECUs")
+        return port
+
+    async def stop(self):
+        if self._tcp_server is not None:
+            self._tcp_server.close()
+            await self._tcp_server.wait_closed()
+            self._tcp_server = None
+        if self._udp_transport is not None:
+            self._udp_transport.close()
+            self._udp_transport = None
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Local DoIP stand-in server backed by ECU_List")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DOIP_PORT)
+    parser.add_argument("--vin", default=DEFAULT_VIN)
+    args = parser.parse_args()
+
+    server = DoIPStandInServer(load_ecu_list(), args.vin)
+    await server.start(args.host, args.port)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\n🛑 User interrupted, exiting")
@@ -0,0 +1,233 @@
+import asyncio
+import socket
+import struct
+
+from diag_session import NEGATIVE_RESPONSE, is_response_to
+
+DOIP_PORT = 13400
+PROTOCOL_VERSION = 0x02      # ISO 13400-2:2012
+DEFAULT_TESTER_ADDRESS = 0x0E00
+
+# Payload types
+VEHICLE_IDENTIFICATION_REQUEST = 0x0001
+VEHICLE_ANNOUNCEMENT = 0x0004
+ROUTING_ACTIVATION_REQUEST = 0x0005
+ROUTING_ACTIVATION_RESPONSE = 0x0006
+ALIVE_CHECK_REQUEST = 0x0007
+ALIVE_CHECK_RESPONSE = 0x0008
+DIAGNOSTIC_MESSAGE = 0x8001
+DIAGNOSTIC_MESSAGE_ACK = 0x8002
+DIAGNOSTIC_MESSAGE_NACK = 0x8003
+GENERIC_NACK = 0x0000
+
+ROUTING_ACTIVATION_SUCCESS = 0x10
+ACTIVATION_TYPE_DEFAULT = 0x00
+
+HEADER = struct.Struct(">BBHI")
+NRC_RESPONSE_PENDING = 0x78
+
+
+def encode_message(payload_type: int, payload: bytes = b"") -> bytes:
+    """Generic DoIP header (version, inverse version, type, length) plus payload"""
+    return HEADER.pack(PROTOCOL_VERSION, PROTOCOL_VERSION ^ 0xFF, payload_type, len(payload)) + payload
+
+
+def encode_diagnostic_message(source: int, target: int, user_data: bytes) -> bytes:
+    return encode_message(DIAGNOSTIC_MESSAGE, struct.pack(">HH", source, target) + user_data)
+
+
+async def read_message(reader: asyncio.StreamReader):
+    """Read one DoIP message; returns (payload_type, payload)"""
+    header = await reader.readexactly(HEADER.size)
+    version, inverse, payload_type, length = HEADER.unpack(header)
+    if version ^ inverse != 0xFF:
+        raise ConnectionError(f"Invalid DoIP header: {header.hex(' ').upper()}")
+    payload = await reader.readexactly(length) if length else b""
+    return payload_type, payload
+
+
+class VehicleAnnouncement:
+    """Decoded vehicle identification response / announcement (payload type 0x0004)"""
+
+    def __init__(self, payload: bytes, address):
+        self.vin = payload[0:17].decode("ascii", errors="replace")
+        self.logical_address = struct.unpack(">H", payload[17:19])[0]
+        self.eid = payload[19:25]
+        self.gid = payload[25:31]
+        self.address = address
+
+    def __repr__(self):
+        return f"VehicleAnnouncement(vin={self.vin}, address=0x{self.logical_address:04X}, ip={self.address[0]})"
+
+
+async def discover_vehicles(broadcast: str = "255.255.255.255", port: int = DOIP_PORT, timeout: float = 2.0) -> list:
+    """Broadcast a vehicle identification request and collect the announcements"""
+    loop = asyncio.get_running_loop()
+    found = []
+
+    class _Protocol(asyncio.DatagramProtocol):
+        def datagram_received(self, data, addr):
+            if len(data) < HEADER.size:
+                return
+            _, _, payload_type, length = HEADER.unpack_from(data)
+            if payload_type == VEHICLE_ANNOUNCEMENT and length >= 31:
+                found.append(VehicleAnnouncement(data[HEADER.size:HEADER.size + length], addr))
+
+    transport, _ = await loop.create_datagram_endpoint(
+        _Protocol, local_addr=("0.0.0.0", 0), allow_broadcast=True, family=socket.AF_INET)
+    try:
+        transport.sendto(encode_message(VEHICLE_IDENTIFICATION_REQUEST), (broadcast, port))
+        await asyncio.sleep(timeout)
+    finally:
+        transport.close()
+    for vehicle in found:
+        print(f"🚗 Found DoIP entity: {vehicle}")
+    return found
+
+
+class DoIPTransport:
+    """UDS request/response over DoIP (see diag_session.py for the interface)"""
+
+    def __init__(self, host: str, port: int = DOIP_PORT, tester_address: int = DEFAULT_TESTER_ADDRESS):
+        self.host = host
+        self.port = port
+        self.tester_address = tester_address
+        self.entity_address = None
+        self.target_address = None
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+        self._responses = asyncio.Queue()
+        self._read_task = None
+        self._read_error = None
+
+    @property
+    def is_connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def open(self):
+        print(f"🔌 Connecting to DoIP entity {self.host}:{self.port}...")
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        sock = self._writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            await self._activate_routing()
+        except BaseException:
+            self._writer.close()
+            self._reader = self._writer = None
+            raise
+        self._read_error = None
+        self._read_task = asyncio.get_running_loop().create_task(self._read_loop())
+
+    async def _activate_routing(self):
+        payload = struct.pack(">HB4s", self.tester_address, ACTIVATION_TYPE_DEFAULT, b"\x00" * 4)
+        self._writer.write(encode_message(ROUTING_ACTIVATION_REQUEST, payload))
+        await self._writer.drain()
+        payload_type, response = await self._read_skipping_alive_checks()
+        if payload_type != ROUTING_ACTIVATION_RESPONSE or len(response) < 5:
+            raise ConnectionError(f"Unexpected routing activation reply type 0x{payload_type:04X}")
+        _, self.entity_address, code = struct.unpack(">HHB", response[:5])
+        if code != ROUTING_ACTIVATION_SUCCESS:
+            raise ConnectionError(f"Routing activation denied (code 0x{code:02X})")
+        print(f"✅ Routing activated, DoIP entity 0x{self.entity_address:04X}")
+
+    async def close(self):
+        if self._writer is None:
+            return
+        if self._read_task is not None:
+            self._read_task.cancel()
+            try:
+                await self._read_task
+            except asyncio.CancelledError:
+                pass
+            self._read_task = None
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except ConnectionError:
+            pass
+        self._reader = self._writer = None
+        print("🔚 DoIP connection closed")
+
+    async def _read_skipping_alive_checks(self):
+        while True:
+            payload_type, payload = await read_message(self._reader)
+            if payload_type == ALIVE_CHECK_REQUEST:
+                self._writer.write(encode_message(ALIVE_CHECK_RESPONSE, struct.pack(">H", self.tester_address)))
+                continue
+            if payload_type == GENERIC_NACK:
+                raise ConnectionError(f"DoIP generic NACK 0x{payload[0]:02X}")
+            return payload_type, payload
+
+    async def select_ecu(self, ecu):
+        """Address following requests to the ECU's DoIP logical address"""
+        self.target_address = ecu.doip_address
+
+    async def _read_loop(self):
+        """Read whole messages in the background so a request timeout never cuts one in half"""
+        try:
+            while True:
+                payload_type, payload = await read_message(self._reader)
+                if payload_type == ALIVE_CHECK_REQUEST:
+                    self._writer.write(encode_message(ALIVE_CHECK_RESPONSE, struct.pack(">H", self.tester_address)))
+                elif payload_type in (DIAGNOSTIC_MESSAGE, DIAGNOSTIC_MESSAGE_NACK, GENERIC_NACK):
+                    self._responses.put_nowait((payload_type, payload))
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            self._read_error = e
+            self._responses.put_nowait((None, b""))
+
+    def _drop_stale_responses(self):
+        while not self._responses.empty():
+            payload_type, payload = self._responses.get_nowait()
+            if payload_type == DIAGNOSTIC_MESSAGE:
+                print(f"⚠️ Dropping unsolicited DoIP reply: {payload[4:].hex(' ').upper()}")
+
+    async def uds_request(self, payload: bytes, timeout_ms: int = 3000):
+        """Send one diagnostic message and return the ECU's UDS response (or None on timeout)"""
+        if self.target_address is None:
+            raise RuntimeError("No ECU selected, call select_ecu() before uds_request()")
+        if self._writer is None:
+            raise RuntimeError("DoIP transport is not open")
+        async with self._lock:
+            self._drop_stale_responses()
+            if self._read_error is not None:
+                raise ConnectionError(f"DoIP connection lost: {self._read_error}")
+            self._writer.write(encode_diagnostic_message(self.tester_address, self.target_address, payload))
+            await self._writer.drain()
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout_ms / 1000
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return None
+                try:
+                    payload_type, message = await asyncio.wait_for(self._responses.get(), remaining)
+                except asyncio.TimeoutError:
+                    return None
+                if payload_type is None:
+                    raise ConnectionError(f"DoIP connection lost: {self._read_error}")
+                if payload_type == GENERIC_NACK:
+                    raise ConnectionError(f"DoIP generic NACK 0x{message[0]:02X}")
+                if payload_type == DIAGNOSTIC_MESSAGE_NACK:
+                    raise ConnectionError(f"Diagnostic message NACK 0x{message[4]:02X}")
+                source, target = struct.unpack(">HH", message[:4])
+                user_data = message[4:]
+                if source != self.target_address or target != self.tester_address:
+                    continue
+                if not is_response_to(payload, user_data):
+                    # Late answer to a request that already timed out
+                    print(f"⚠️ Dropping stale DoIP reply: {user_data.hex(' ').upper()}")
+                    continue
+                if user_data[0] == NEGATIVE_RESPONSE and len(user_data) >= 3 and user_data[2] == NRC_RESPONSE_PENDING:
+                    # ECU asked for more time: restart the response timer
+                    deadline = loop.time() + timeout_ms / 1000
+                    continue
+                return user_data
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
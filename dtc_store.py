@@ -0,0 +1,226 @@
+"""Local SQLite history of DTC snapshots (19 02 reads) across vehicles and ECUs.
+
+One row in `scans` per (VIN, ECU, time) read and one row in `dtcs` per DTC
+in it; `dtcs` repeats the scan's VIN, node and time so a code/time range
+query is answered from one index. `ecu_latest` keeps the last two scans of
+every VIN/ECU so "new since the previous scan" is an indexed lookup instead
+of a window over the whole history. Snapshots are appended in bulk, one transaction per batch.
+"""
+import argparse
+import os
+import sqlite3
+import time
+
+from diag_session import STATUS_CONFIRMED
+
+DTC_STORE_PATH = os.path.join(os.path.expanduser("~"), ".linkobd_dtc_history.sqlite")
+SECONDS_PER_DAY = 86400
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    scan_id    INTEGER PRIMARY KEY,
+    vin        TEXT NOT NULL,
+    node       TEXT NOT NULL,
+    ecu_id     TEXT,
+    scanned_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dtcs (
+    scan_id    INTEGER NOT NULL REFERENCES scans(scan_id),
+    code       INTEGER NOT NULL,
+    status     INTEGER NOT NULL,
+    vin        TEXT NOT NULL,
+    node       TEXT NOT NULL,
+    scanned_at REAL NOT NULL,
+    PRIMARY KEY (scan_id, code)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS ecu_latest (
+    vin              TEXT NOT NULL,
+    node             TEXT NOT NULL,
+    scan_id          INTEGER NOT NULL,
+    scanned_at       REAL NOT NULL,
+    previous_scan_id INTEGER,
+    PRIMARY KEY (vin, node)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS scans_vin_node_time ON scans (vin, node, scanned_at);
+CREATE INDEX IF NOT EXISTS scans_node_time ON scans (node, scanned_at);
+CREATE INDEX IF NOT EXISTS scans_time ON scans (scanned_at);
+-- A code and time range is one index range; status bits, VIN and node are
+-- read from the same covering index, so the query never reads the table
+CREATE INDEX IF NOT EXISTS dtcs_code_time ON dtcs (code, scanned_at, status, vin, node);
+"""
+
+
+def parse_dtc_code(code) -> int:
+    """Accept 0xD10000, 13697024 or 'D10000'"""
+    if isinstance(code, int):
+        return code
+    return int(code.strip().upper().removeprefix("0X"), 16)
+
+
+def format_dtc_code(code: int) -> str:
+    return f"{code:06X}"
+
+
+class DtcSnapshot:
+    """DTCs read from one ECU of one vehicle at one time"""
+
+    def __init__(self, vin: str, node: str, ecu_id: str, dtcs, scanned_at: float = None):
+        self.vin = vin
+        self.node = node
+        self.ecu_id = ecu_id
+        self.dtcs = dtcs
+        self.scanned_at = time.time() if scanned_at is None else scanned_at
+
+
+def snapshots_from_sweep(vin: str, results, scanned_at: float = None) -> list:
+    """Turn diag_session.sweep() results into snapshots (ECUs that errored are skipped)"""
+    scanned_at = time.time() if scanned_at is None else scanned_at
+    return [
+        DtcSnapshot(vin, result["ecu"].node, result["ecu"].ecu_id, result["dtcs"], scanned_at)
+        for result in results if "dtcs" in result
+    ]
+
+
+class DtcStore:
+    def __init__(self, path: str = DTC_STORE_PATH):
+        self.path = path
+        # Transactions are opened explicitly (see append)
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def append(self, snapshots) -> int:
+        """Store snapshots in one transaction; returns the number of DTC rows written"""
+        db = self._db
+        # IMMEDIATE takes the write lock before scan IDs are read, so concurrent
+        # ingest processes queue up instead of colliding on MAX(scan_id) + 1
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            next_id = db.execute("SELECT COALESCE(MAX(scan_id), 0) + 1 FROM scans").fetchone()[0]
+            scan_rows = []
+            dtc_rows = []
+            for scan_id, snapshot in enumerate(snapshots, next_id):
+                scan_rows.append((scan_id, snapshot.vin, snapshot.node, snapshot.ecu_id, snapshot.scanned_at))
+                dtc_rows.extend((scan_id, dtc.code, dtc.status, snapshot.vin, snapshot.node, snapshot.scanned_at)
+                                for dtc in snapshot.dtcs)
+            db.executemany("INSERT INTO scans VALUES (?, ?, ?, ?, ?)", scan_rows)
+            # A DTC reported twice in one response keeps its last status
+            db.executemany("INSERT OR REPLACE INTO dtcs VALUES (?, ?, ?, ?, ?, ?)", dtc_rows)
+            # Scans of a batch are applied in time order so older ones never overtake newer ones
+            db.executemany(
+                """
+                INSERT INTO ecu_latest (vin, node, scan_id, scanned_at, previous_scan_id)
+                VALUES (?, ?, ?, ?, NULL)
+                ON CONFLICT (vin, node) DO UPDATE SET
+                    previous_scan_id = ecu_latest.scan_id,
+                    scan_id = excluded.scan_id,
+                    scanned_at = excluded.scanned_at
+                WHERE excluded.scanned_at >= ecu_latest.scanned_at
+                """,
+                [(vin, node, scan_id, scanned_at)
+                 for scan_id, vin, node, _, scanned_at in sorted(scan_rows, key=lambda row: row[4])],
+            )
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+        return len(dtc_rows)
+
+    def vehicles_with_dtc(self, code, status_mask: int = STATUS_CONFIRMED, since: float = None,
+                          until: float = None) -> list:
+        """(vin, node, ecu_id, last seen, status) for every vehicle/ECU that reported the code
+        with any of the status_mask bits set in the time range"""
+        since = 0 if since is None else since
+        until = float("inf") if until is None else until
+        # dtcs_code_time serves the code and time range; only the latest hit
+        # per vehicle/ECU is looked up in scans, for its ecu_id.
+        # SQLite takes the bare scan_id and status from the row holding MAX(scanned_at).
+        return self._db.execute(
+            """
+            SELECT d.vin, d.node, s.ecu_id, d.last_seen, d.status
+            FROM (
+                SELECT vin, node, scan_id, MAX(scanned_at) AS last_seen, status
+                FROM dtcs
+                WHERE code = ? AND scanned_at >= ? AND scanned_at <= ? AND status & ?
+                GROUP BY vin, node
+            ) d
+            JOIN scans s ON s.scan_id = d.scan_id
+            ORDER BY d.vin, d.node
+            """,
+            (parse_dtc_code(code), since, until, status_mask),
+        ).fetchall()
+
+    def new_since_previous_scan(self, vin: str = None, node: str = None) -> list:
+        """(vin, node, code, status) for DTCs in the latest scan of an ECU that were not in the one before"""
+        # Only the filters actually given go into the WHERE clause so the primary key can be used
+        filters, params = _filters(("l.vin", vin), ("l.node", node))
+        return self._db.execute(
+            f"""
+            SELECT l.vin, l.node, d.code, d.status
+            FROM ecu_latest l
+            JOIN dtcs d ON d.scan_id = l.scan_id
+            WHERE {filters} NOT EXISTS (
+                SELECT 1 FROM dtcs p WHERE p.scan_id = l.previous_scan_id AND p.code = d.code)
+            ORDER BY l.vin, l.node, d.code
+            """,
+            params,
+        ).fetchall()
+
+    def history(self, vin: str, node: str = None, since: float = None) -> list:
+        """(node, scanned_at, code, status) rows for one vehicle, newest first"""
+        filters, params = _filters(("s.vin", vin), ("s.node", node))
+        return self._db.execute(
+            f"""
+            SELECT s.node, s.scanned_at, d.code, d.status
+            FROM scans s JOIN dtcs d ON d.scan_id = s.scan_id
+            WHERE {filters} s.scanned_at >= ?
+            ORDER BY s.scanned_at DESC, s.node, d.code
+            """,
+            params + [0 if since is None else since],
+        ).fetchall()
+
+
+def _filters(*columns):
+    """'col = ? AND ' fragments and parameters for the (column, value) pairs whose value is set"""
+    given = [(column, value) for column, value in columns if value is not None]
+    return "".join(f"{column} = ? AND " for column, _ in given), [value for _, value in given]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the local DTC history store")
+    parser.add_argument("--db", default=DTC_STORE_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+    confirmed = sub.add_parser("confirmed", help="Vehicles with a confirmed DTC")
+    confirmed.add_argument("code", help="DTC code, e.g. D10000")
+    confirmed.add_argument("--days", type=float, default=7)
+    new = sub.add_parser("new", help="DTCs new since the previous scan")
+    new.add_argument("--vin")
+    new.add_argument("--node")
+    args = parser.parse_args()
+
+    with DtcStore(args.db) as store:
+        started = time.perf_counter()
+        if args.command == "confirmed":
+            rows = store.vehicles_with_dtc(args.code, since=time.time() - args.days * SECONDS_PER_DAY)
+            for vin, node, ecu_id, scanned_at, status in rows:
+                print(f"🚗 {vin} ECU {node} ({ecu_id}) {time.strftime('%Y-%m-%d %H:%M', time.localtime(scanned_at))} "
+                      f"Status:0x{status:02X}({status:08b})")
+        else:
+            rows = store.new_since_previous_scan(args.vin, args.node)
+            for vin, node, code, status in rows:
+                print(f"🆕 {vin} ECU {node} Code 0x{format_dtc_code(code)} ({code}) Status:0x{status:02X}({status:08b})")
+        print(f"📊 {len(rows)} rows in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
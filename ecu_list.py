@@ -0,0 +1,98 @@
+import os
+import xml.etree.ElementTree as ET
+
+ECU_LIST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ECU_List(1).xml")
+
+# Identification DIDs read from every ECU and the ECU_List ident field each one maps to
+IDENT_DIDS = {
+    0xF187: "IDE00007",  # VW/Audi part number
+    0xF189: "IDE00008",  # software version
+    0xF191: "IDE00012",  # hardware part number
+    0xF197: "IDE00013",  # system name
+    0xF19E: "IDE00072",  # ASAM/ODX file ID
+    0xF1A2: "IDE00073",  # ASAM/ODX file version
+    0xF1A3: "IDE00016",  # hardware version
+    0x0600: "IDE00003",  # coding
+}
+
+# Fields whose value is raw binary, shown as hex bytes in ECU_List
+HEX_IDENT_FIELDS = {"IDE00003"}
+
+IDENT_FIELD_NAMES = {
+    "IDE00007": "part number",
+    "IDE00008": "SW version",
+    "IDE00012": "HW part number",
+    "IDE00013": "system name",
+    "IDE00072": "ODX file ID",
+    "IDE00073": "ODX file version",
+    "IDE00016": "HW version",
+    "IDE00003": "coding",
+}
+
+
+class EcuEntry:
+    """One <ecu> element of ECU_List"""
+
+    def __init__(self, node, doip_address, can_req_id, can_resp_id, ecu_id, name_en, name_zh,
+                 logical_link, ident):
+        self.node = node
+        self.doip_address = doip_address
+        self.can_req_id = can_req_id
+        self.can_resp_id = can_resp_id
+        self.ecu_id = ecu_id
+        self.name_en = name_en
+        self.name_zh = name_zh
+        self.logical_link = logical_link
+        # ti_name -> display_value for the top-level ident values
+        self.ident = ident
+
+    @property
+    def filter_mask(self) -> int:
+        """Adapter filter mask for the response ID, as EcuInfo.filterMask in the app"""
+        if self.can_resp_id is None:
+            return 0xFFFFFFFF
+        return 0x7FF if self.can_resp_id <= 0x7FF else 0x1FFFFFFF
+
+    def __repr__(self):
+        return f"EcuEntry(node={self.node}, doip=0x{self.doip_address:04X}, {self.name_en})"
+
+
+def _hex_field(element, tag):
+    text = element.findtext(tag)
+    return int(text, 16) if text else None
+
+
+def load_ecu_list(path: str = ECU_LIST_PATH) -> list:
+    """Parse ECU_List into EcuEntry objects, in file order"""
+    entries = []
+    for ecu in ET.parse(path).getroot().iter("ecu"):
+        ident = {}
+        master = ecu.find("ecu_master[@type='ident']")
+        if master is not None:
+            for value in master.findall("values"):
+                ti_name = value.findtext("ti_name")
+                display_value = value.findtext("display_value")
+                if ti_name and display_value is not None:
+                    # Long hex values wrap over several indented lines in the XML
+                    ident[ti_name] = " ".join(display_value.split())
+        entries.append(EcuEntry(
+            node=ecu.findtext("Node"),
+            doip_address=_hex_field(ecu, "DoIP_ECU"),
+            can_req_id=_hex_field(ecu, "CP_CanPhysReqId"),
+            can_resp_id=_hex_field(ecu, "CP_CanRespUSDTId"),
+            ecu_id=ecu.findtext("ecu_id"),
+            name_en=ecu.findtext("us_en"),
+            name_zh=ecu.findtext("zh_cn"),
+            logical_link=ecu.findtext("logicallink"),
+            ident=ident,
+        ))
+    return entries
+
+
+def find_ecu(entries, node: str):
+    """Look up an ECU by its node address (e.g. '0C')"""
+    node = node.upper()
+    for entry in entries:
+        if entry.node == node:
+            return entry
+    return None
@@ -0,0 +1,143 @@
+"""Diff live identification reads against the ECU_List reference values.
+
+Records stream in as (vin, node, {ti_name: value}) from many vehicles and are
+compared in batches one column (ident field) at a time: the reference column
+is gathered through a node -> row index and the live and reference columns
+are compared with map/compress, so no per-field Python loop runs per record.
+Only mismatches come out, grouped into a compact report.
+"""
+import argparse
+import itertools
+import json
+import operator
+import sys
+from collections import Counter, defaultdict
+
+from ecu_list import IDENT_DIDS, IDENT_FIELD_NAMES, load_ecu_list
+
+DEFAULT_BATCH_SIZE = 10000
+REPORT_VIN_SAMPLE = 3
+# Mismatch.field for a record whose node is not in ECU_List (actual holds the node)
+UNKNOWN_NODE = "unknown_node"
+
+
+class Mismatch:
+    __slots__ = ("vin", "node", "field", "expected", "actual")
+
+    def __init__(self, vin, node, field, expected, actual):
+        self.vin = vin
+        self.node = node
+        self.field = field
+        self.expected = expected
+        self.actual = actual
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class IdentReference:
+    """ECU_List ident values laid out as one column per field, indexed by node"""
+
+    def __init__(self, ecus, fields=tuple(IDENT_DIDS.values())):
+        self.fields = tuple(fields)
+        self.row_of = {ecu.node: row for row, ecu in enumerate(ecus)}
+        # One extra all-None row for nodes missing from ECU_List
+        self.unknown_row = len(ecus)
+        self.columns = {
+            field: [ecu.ident.get(field) for ecu in ecus] + [None]
+            for field in self.fields
+        }
+
+
+def diff_batch(reference: IdentReference, vins, nodes, idents) -> list:
+    """Compare one batch of records (parallel lists); returns the mismatches"""
+    rows = [reference.row_of.get(node, reference.unknown_row) for node in nodes]
+    # Without a reference row no field can be compared, so report the node itself
+    unknown = map(operator.eq, rows, itertools.repeat(reference.unknown_row))
+    mismatches = [Mismatch(vins[index], nodes[index], UNKNOWN_NODE, None, nodes[index])
+                  for index in itertools.compress(range(len(rows)), unknown)]
+    for field in reference.fields:
+        live = list(map(operator.methodcaller("get", field), idents))
+        expected = list(map(reference.columns[field].__getitem__, rows))
+        # A field counts only when it was read and has a reference value
+        compared = map(operator.and_,
+                       map(operator.is_not, live, itertools.repeat(None)),
+                       map(operator.is_not, expected, itertools.repeat(None)))
+        differs = map(operator.and_, compared, map(operator.ne, live, expected))
+        for index in itertools.compress(range(len(live)), differs):
+            mismatches.append(Mismatch(vins[index], nodes[index], field, expected[index], live[index]))
+    return mismatches
+
+
+def diff_stream(reference: IdentReference, records, batch_size: int = DEFAULT_BATCH_SIZE):
+    """Yield mismatches for an iterable of (vin, node, ident dict) records"""
+    records = iter(records)
+    while True:
+        batch = list(itertools.islice(records, batch_size))
+        if not batch:
+            return
+        vins, nodes, idents = zip(*batch)
+        yield from diff_batch(reference, vins, nodes, idents)
+
+
+def records_from_sweep(vin: str, results):
+    """(vin, node, ident) records from diag_session.sweep() results"""
+    for result in results:
+        if "ident" in result:
+            yield vin, result["ecu"].node, result["ident"]
+
+
+def read_jsonl_records(stream):
+    """(vin, node, ident) records from JSON lines {"vin": ..., "node": ..., "ident": {...}}"""
+    for line in stream:
+        line = line.strip()
+        if line:
+            record = json.loads(line)
+            yield record["vin"], record["node"].upper(), record["ident"]
+
+
+def print_report(mismatches, ecus_by_node: dict):
+    """One line per (ECU, field, expected, actual) with the number of affected vehicles"""
+    groups = defaultdict(list)
+    for mismatch in mismatches:
+        groups[(mismatch.node, mismatch.field, mismatch.expected, mismatch.actual)].append(mismatch.vin)
+    if not groups:
+        print("✅ No identification mismatches")
+        return
+    for (node, field, expected, actual), vins in sorted(groups.items(), key=lambda item: (item[0][0], item[0][1])):
+        ecu = ecus_by_node.get(node)
+        sample = ", ".join(vins[:REPORT_VIN_SAMPLE]) + (", ..." if len(vins) > REPORT_VIN_SAMPLE else "")
+        if field == UNKNOWN_NODE:
+            print(f"⚠️ ECU {node} is not in ECU_List, seen on {len(vins)} vehicle(s) [{sample}]")
+            continue
+        print(f"❌ ECU {node} {ecu.name_en if ecu else ''} | {IDENT_FIELD_NAMES.get(field, field)}: "
+              f"expected {expected!r}, got {actual!r} on {len(vins)} vehicle(s) [{sample}]")
+    by_field = Counter(mismatch.field for mismatch in mismatches)
+    print("📊 " + ", ".join(f"{IDENT_FIELD_NAMES.get(f, 'Unknown node' if f == UNKNOWN_NODE else f)}: {n}"
+                           for f, n in by_field.most_common()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Diff identification reads against ECU_List")
+    parser.add_argument("records", nargs="?", help="JSONL file of reads (default: stdin)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--jsonl", action="store_true", help="Emit mismatches as JSON lines instead of a report")
+    args = parser.parse_args()
+
+    ecus = load_ecu_list()
+    reference = IdentReference(ecus)
+    stream = open(args.records, "r", encoding="utf-8") if args.records else sys.stdin
+    try:
+        mismatches = diff_stream(reference, read_jsonl_records(stream), args.batch_size)
+        if args.jsonl:
+            for mismatch in mismatches:
+                print(json.dumps(mismatch.to_dict(), ensure_ascii=False))
+        else:
+            print_report(list(mismatches), {ecu.node: ecu for ecu in ecus})
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+if __name__ == "__main__":
+    main()
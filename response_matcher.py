@@ -0,0 +1,224 @@
+"""Streaming expectation engine for adapter notifications.
+
+Callers register what they are waiting for *before* writing a request:
+byte patterns (config acks, per-index ACKs) and/or predicates over complete
+55 A9 response frames (NRCs, a given service response). Every notification
+chunk is fed once; patterns are matched incrementally with a precompiled
+Aho-Corasick automaton whose state carries across chunk boundaries, so
+nothing is rescanned or trimmed mid-match, and each waiting future resolves
+as soon as its pattern or frame completes.
+"""
+import asyncio
+
+RESPONSE_HEADER = b'\x55\xA9'
+AUTOMATON_CACHE_SIZE = 32
+MIN_TAIL_LENGTH = 64
+
+
+class ResponseFrameReassembler:
+    """Incrementally reassemble 55 A9 response frames from BLE notification chunks"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data) -> list:
+        """Append a chunk and return every complete frame it finished"""
+        buffer = self._buffer
+        buffer += data
+        frames = []
+        pos = 0
+        view = memoryview(buffer)
+        try:
+            while True:
+                start = buffer.find(RESPONSE_HEADER, pos)
+                if start < 0:
+                    # Keep a trailing 0x55 in case the header is split across chunks
+                    pos = len(buffer) - 1 if buffer.endswith(b'\x55') else len(buffer)
+                    break
+                if len(buffer) - start < 4:
+                    pos = start
+                    break
+                # Header(2) + DLC(2, big-endian) + data + CRC(1)
+                total_len = 4 + ((buffer[start + 2] << 8) | buffer[start + 3]) + 1
+                if len(buffer) - start < total_len:
+                    pos = start
+                    break
+                frames.append(bytes(view[start:start + total_len]))
+                pos = start + total_len
+        finally:
+            view.release()
+        if pos:
+            del buffer[:pos]
+        return frames
+
+    def clear(self):
+        self._buffer.clear()
+
+
+class PatternAutomaton:
+    """Aho-Corasick automaton compiled to a dense byte-transition table"""
+
+    def __init__(self, patterns):
+        self.patterns = tuple(patterns)
+        self.max_length = max((len(p) for p in self.patterns), default=0)
+        goto = [{}]
+        outputs = [[]]
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for byte in pattern:
+                next_state = goto[state].get(byte)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][byte] = next_state
+                    goto.append({})
+                    outputs.append([])
+                state = next_state
+            outputs[state].append(index)
+
+        # Breadth-first: fill every missing transition from the failure state,
+        # which is already complete because it is shallower
+        delta = [None] * len(goto)
+        delta[0] = [goto[0].get(byte, 0) for byte in range(256)]
+        failure = [0] * len(goto)
+        queue = list(goto[0].values())
+        for state in queue:
+            row = list(delta[failure[state]])
+            for byte, next_state in goto[state].items():
+                row[byte] = next_state
+                failure[next_state] = delta[failure[state]][byte]
+                outputs[next_state] = outputs[next_state] + outputs[failure[next_state]]
+                queue.append(next_state)
+            delta[state] = row
+        self._delta = delta
+        self._outputs = [tuple(o) for o in outputs]
+
+    def scan(self, state: int, data, report: bool = True):
+        """Advance from `state` over `data`.
+
+        Returns (new state, [(pattern index, offset just past the match in data)]).
+        """
+        delta = self._delta
+        outputs = self._outputs
+        matched = []
+        for offset, byte in enumerate(data, 1):
+            state = delta[state][byte]
+            if report and outputs[state]:
+                matched.extend((index, offset) for index in outputs[state])
+        return state, matched
+
+
+class ExpectationEngine:
+    """Resolve many pending pattern/frame expectations from one notification stream"""
+
+    def __init__(self):
+        self._pattern_waiters = []   # (pattern, stream position when registered, future)
+        self._frame_waiters = []     # (predicate, future)
+        self._automaton = PatternAutomaton(())
+        self._automata = {}
+        self._state = 0
+        # Total bytes fed so far; a match only counts for waiters registered before it started
+        self._position = 0
+        # Last bytes fed, just enough to restore automaton state after a recompile
+        self._tail = bytearray()
+        self._reassembler = ResponseFrameReassembler()
+
+    def _compile(self):
+        patterns = tuple(sorted({pattern for pattern, _, _ in self._pattern_waiters}))
+        if patterns == self._automaton.patterns:
+            return
+        automaton = self._automata.pop(patterns, None)
+        if automaton is None:
+            automaton = PatternAutomaton(patterns)
+            if len(self._automata) >= AUTOMATON_CACHE_SIZE:
+                self._automata.pop(next(iter(self._automata)))
+        self._automata[patterns] = automaton
+        self._automaton = automaton
+        # Re-run the tail silently so a pattern split across chunks still completes for
+        # the waiters that were already registered; new waiters ignore these bytes
+        # because their matches are checked against their registration position
+        self._state, _ = automaton.scan(0, self._tail, report=False)
+
+    def expect(self, pattern: bytes) -> asyncio.Future:
+        """Future resolved with `pattern` once it appears in data fed after this call"""
+        future = asyncio.get_running_loop().create_future()
+        self._pattern_waiters.append((bytes(pattern), self._position, future))
+        self._compile()
+        return future
+
+    def expect_frame(self, predicate=None) -> asyncio.Future:
+        """Future resolved with the first complete 55 A9 frame for which predicate(frame) is true"""
+        future = asyncio.get_running_loop().create_future()
+        self._frame_waiters.append((predicate, future))
+        return future
+
+    def cancel(self, *futures):
+        """Withdraw expectations that are no longer wanted"""
+        for future in futures:
+            future.cancel()
+        self._prune()
+
+    def _prune(self):
+        self._pattern_waiters = [w for w in self._pattern_waiters if not w[2].done()]
+        self._frame_waiters = [w for w in self._frame_waiters if not w[1].done()]
+        if not self._frame_waiters:
+            # Nobody is waiting for a frame, so a partial one can only be stale
+            self._reassembler.clear()
+        self._compile()
+
+    def resync(self):
+        """Discard any partially reassembled frame"""
+        self._reassembler.clear()
+
+    def feed(self, data):
+        """Consume one notification chunk"""
+        start = self._position
+        self._position += len(data)
+        if self._pattern_waiters:
+            automaton = self._automaton
+            self._state, matched = automaton.scan(self._state, data)
+            for index, offset in matched:
+                pattern = automaton.patterns[index]
+                match_start = start + offset - len(pattern)
+                for waiting, registered_at, future in self._pattern_waiters:
+                    if waiting == pattern and registered_at <= match_start and not future.done():
+                        future.set_result(pattern)
+        keep = max(self._automaton.max_length - 1, MIN_TAIL_LENGTH)
+        self._tail += data
+        if len(self._tail) > keep:
+            del self._tail[:-keep]
+
+        # Pattern-only traffic (e.g. 55 A9 03 <idx> ACKs) would otherwise be taken
+        # for the header of a long frame and hold back every frame after it
+        if self._frame_waiters:
+            for frame in self._reassembler.feed(data):
+                for predicate, future in self._frame_waiters:
+                    if not future.done() and (predicate is None or predicate(frame)):
+                        future.set_result(frame)
+
+        self._prune()
+
+    async def wait(self, future: asyncio.Future, timeout_ms: int):
+        """Await one expectation; returns its result, or None on timeout"""
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout_ms / 1000)
+        except asyncio.TimeoutError:
+            self._cancel_timed_out(future)
+            return None
+
+    async def wait_any(self, futures, timeout_ms: int):
+        """Await the first of several expectations; the rest are withdrawn"""
+        done, pending = await asyncio.wait(futures, timeout=timeout_ms / 1000,
+                                           return_when=asyncio.FIRST_COMPLETED)
+        if not done:
+            self._cancel_timed_out(*pending)
+            return None
+        self.cancel(*pending)
+        return next(iter(done)).result()
+
+    def _cancel_timed_out(self, *futures):
+        # A frame that has not completed within a whole response timeout never will
+        # (e.g. a bogus length claimed by stray bytes), so start over at the next header
+        waiting_for_frames = {future for _, future in self._frame_waiters}
+        if waiting_for_frames.intersection(futures):
+            self.resync()
+        self.cancel(*futures)
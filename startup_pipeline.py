@@ -0,0 +1,226 @@
+"""Pipelined BLE session startup with per-phase timing.
+
+Scan (only when asked) stops at the first matching advertisement, pairing is
+skipped for adapters already bonded (and redone if setup then fails, in case
+the bond went stale), notifications count as ready as soon as
+start_notify returns, and the configuration frames are written immediately
+after that with their acks awaited together. Every session's phase breakdown,
+including time to first response, is printed and appended to a JSONL log.
+"""
+import json
+import os
+import platform
+import time
+
+from bleak import BleakClient, BleakScanner
+
+from adapter_config import NOTIFY_UUID, AdapterConfigState, configure_adapter
+
+BOND_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".linkobd_bonds.json")
+STARTUP_LOG_PATH = os.path.join(os.path.expanduser("~"), ".linkobd_startup_timings.jsonl")
+SCAN_TIMEOUT_S = 10.0
+
+
+class StartupTimings:
+    """Wall clock breakdown of one session startup"""
+
+    def __init__(self, address: str):
+        self.address = address
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.config_frames_sent = None
+        self._phase_start = self.started
+
+    def phase_done(self, name: str):
+        """Record the time spent since the previous phase ended"""
+        now = time.perf_counter()
+        self.phases[name] = now - self._phase_start
+        self._phase_start = now
+
+    def first_response(self):
+        """Record time-to-first-response, measured from the start of the session"""
+        if "first_response" not in self.phases:
+            self.phase_done("first_exchange")
+            self.phases["first_response"] = time.perf_counter() - self.started
+
+    def report(self, log_path: str = STARTUP_LOG_PATH):
+        print("⏱️ Startup timing:")
+        for name, seconds in self.phases.items():
+            print(f"   {name:15s} {seconds * 1000:8.1f} ms")
+        if not log_path:
+            return
+        entry = {
+            "address": self.address,
+            "timestamp": time.time(),
+            "phases_ms": {name: round(seconds * 1000, 1) for name, seconds in self.phases.items()},
+        }
+        try:
+            with open(log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            print(f"⚠️ Could not write startup log {log_path}: {e}")
+
+
+class BondCache:
+    """Adapters that have already been paired from this machine"""
+
+    def __init__(self, path: str = BOND_CACHE_PATH):
+        self.path = path
+        self._bonded = set()
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self._bonded = set(json.load(f))
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Ignoring unreadable bond cache {path}: {e}")
+
+    def is_bonded(self, address: str) -> bool:
+        return address.upper() in self._bonded
+
+    def record(self, address: str):
+        self._bonded.add(address.upper())
+        self._save()
+
+    def forget(self, address: str):
+        self._bonded.discard(address.upper())
+        self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(sorted(self._bonded), f)
+        except OSError as e:
+            print(f"⚠️ Could not save bond cache {self.path}: {e}")
+
+
+async def find_device(address: str, device_name: str = None, timeout: float = SCAN_TIMEOUT_S):
+    """Scan until the adapter advertises instead of waiting out a full discovery window"""
+    def matches(device, advertisement_data):
+        return device.address.upper() == address.upper() or (
+            device_name is not None and device.name is not None and device_name in device.name)
+
+    print("🔍 Scanning for BLE device...")
+    device = await BleakScanner.find_device_by_filter(matches, timeout=timeout)
+    if device is None:
+        print(f"❌ Device {device_name or ''} ({address}) not found")
+    else:
+        print(f"✅ Found target device: {device.name} ({device.address})")
+    return device
+
+
+async def pair_if_needed(client, address: str, bonds: BondCache) -> bool:
+    if bonds.is_bonded(address):
+        print("⏭️ Adapter already bonded, skipping pairing")
+        return True
+    try:
+        if platform.system() == "Darwin":
+            # macOS pairs on demand; pair() only triggers it
+            paired = await client.pair()
+        else:
+            paired = await client.pair(protection_level=2)
+    except Exception as e:
+        print(f"⚠️ Pairing skipped or failed: {e}")
+        return platform.system() == "Darwin"
+    print(f"Pairing status: {paired}")
+    if paired:
+        bonds.record(address)
+    # macOS keeps going without an explicit bond, as diag.py always did
+    return bool(paired) or platform.system() == "Darwin"
+
+
+async def start_session(address: str, handle_notify, engine=None, config=None, config_state=None,
+                        scan: bool = False, device_name: str = None, pair: bool = True,
+                        bonds: BondCache = None):
+    """Connect, pair, enable notifications and configure the adapter.
+
+    Returns (client, timings); client is None when startup failed. The caller
+    owns the connection and should call timings.first_response() when the
+    first response arrives, then timings.report().
+    """
+    timings = StartupTimings(address)
+    if config is not None and config_state is None:
+        config_state = AdapterConfigState(address)
+    target = address
+    if scan:
+        device = await find_device(address, device_name)
+        timings.phase_done("scan")
+        if device is not None:
+            target = device
+        else:
+            print("⚠️ Scan failed, trying direct connection...")
+
+    print(f"🔌 Connecting to {device_name or 'adapter'} ({address})...")
+    client = BleakClient(target)
+    try:
+        await client.connect()
+    except Exception as e:
+        print(f"❌ Connection failed: {e}")
+        return None, timings
+    timings.phase_done("connect")
+    print("✅ BLE connected")
+
+    try:
+        if await _set_up_connection(client, address, handle_notify, engine, config, config_state,
+                                    pair, bonds, timings):
+            return client, timings
+    except Exception as e:
+        print(f"❌ Session startup failed: {e}")
+    await _disconnect_quietly(client)
+    return None, timings
+
+
+async def _set_up_connection(client, address, handle_notify, engine, config, config_state, pair, bonds,
+                             timings) -> bool:
+    """Pair, enable notifications and configure; False when the adapter refused"""
+    pair_skipped = False
+    if pair:
+        if bonds is None:
+            bonds = BondCache()
+        pair_skipped = bonds.is_bonded(address)
+        if not await pair_if_needed(client, address, bonds):
+            print("❌ Pairing failed")
+            return False
+        timings.phase_done("pair")
+
+    notifying = False
+
+    async def notify_and_configure() -> bool:
+        nonlocal notifying
+        if not notifying:
+            # start_notify returns once the CCCD write is acknowledged: that is the readiness signal
+            await client.start_notify(NOTIFY_UUID, handle_notify)
+            notifying = True
+            timings.phase_done("notify")
+            print("✅ BLE notifications enabled")
+        if config is not None:
+            sent = await configure_adapter(client, engine, config_state, config)
+            if sent is None:
+                return False
+            timings.config_frames_sent = sent
+            timings.phase_done("config")
+        return True
+
+    if not pair_skipped:
+        return await notify_and_configure()
+    try:
+        if await notify_and_configure():
+            return True
+    except Exception as e:
+        print(f"⚠️ Setup failed with the remembered bond: {e}")
+    # The OS bond may have been removed or the adapter reset since it was recorded
+    print("🔁 Pairing again...")
+    bonds.forget(address)
+    if not await pair_if_needed(client, address, bonds):
+        print("❌ Pairing failed")
+        return False
+    timings.phase_done("repair")
+    return await notify_and_configure()
+
+
+async def _disconnect_quietly(client):
+    try:
+        await client.disconnect()
+    except Exception as e:
+        print(f"⚠️ Disconnect failed: {e}")
@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+from diag_session import read_did, sweep
+from doip_server import GATEWAY_ADDRESS, DoIPStandInServer
+from doip_transport import DoIPTransport, encode_diagnostic_message
+from ecu_list import EcuEntry, load_ecu_list
+
+ECUS = load_ecu_list()[:3]
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def with_stand_in(scenario):
+    server = DoIPStandInServer(ECUS)
+    port = await server.start("127.0.0.1", 0)
+    try:
+        async with DoIPTransport("127.0.0.1", port) as transport:
+            return await scenario(transport)
+    finally:
+        await server.stop()
+
+
+def test_routing_activation():
+    async def scenario(transport):
+        return transport.is_connected, transport.entity_address
+
+    assert run(with_stand_in(scenario)) == (True, GATEWAY_ADDRESS)
+
+
+def test_ident_and_dtc_sweep():
+    results = run(with_stand_in(lambda transport: sweep(transport, ECUS)))
+    assert [result["ecu"] for result in results] == ECUS
+    assert all("error" not in result for result in results)
+    assert results[0]["ident"]["IDE00007"] == ECUS[0].ident["IDE00007"]
+    assert results[0]["ident"]["IDE00003"] == ECUS[0].ident["IDE00003"]
+    assert [f"{dtc.code:06X}" for dtc in results[0]["dtcs"]][:3] == ["D10000", "D20000", "D30000"]
+    assert results[1]["dtcs"] == []
+
+
+def test_unknown_target_is_nacked():
+    unknown = EcuEntry("7F", 0x4FFF, None, None, None, "Unknown", None, None, {})
+
+    async def scenario(transport):
+        await transport.select_ecu(unknown)
+        with pytest.raises(ConnectionError, match="NACK 0x03"):
+            await transport.uds_request(bytes([0x22, 0xF1, 0x87]))
+        # The connection stays usable for the next ECU
+        await transport.select_ecu(ECUS[0])
+        return await read_did(transport, 0xF187)
+
+    assert run(with_stand_in(scenario)) == ECUS[0].ident["IDE00007"].encode()
+
+
+def test_stale_reply_is_dropped():
+    async def scenario(transport):
+        await transport.select_ecu(ECUS[0])
+        # A request whose answer nobody waits for, like one that timed out earlier
+        transport._writer.write(encode_diagnostic_message(
+            transport.tester_address, transport.target_address, bytes([0x22, 0xF1, 0x89])))
+        return await transport.uds_request(bytes([0x22, 0xF1, 0x87]))
+
+    response = run(with_stand_in(scenario))
+    assert response == bytes([0x62, 0xF1, 0x87]) + ECUS[0].ident["IDE00007"].encode()
+
+
+def test_request_without_selected_ecu():
+    async def scenario(transport):
+        with pytest.raises(RuntimeError, match="select_ecu"):
+            await transport.uds_request(bytes([0x22, 0xF1, 0x87]))
+
+    run(with_stand_in(scenario))
@@ -0,0 +1,73 @@
+from diag_session import STATUS_CONFIRMED, STATUS_PENDING, Dtc
+from dtc_store import DtcSnapshot, DtcStore
+
+VIN = "WAUZZZ4N0PN000001"
+OTHER_VIN = "WAUZZZ4N0PN000002"
+CONFIRMED = STATUS_CONFIRMED | 0x01
+PENDING = STATUS_PENDING
+
+
+def snapshot(vin, node, dtcs, scanned_at):
+    return DtcSnapshot(vin, node, f"ECU{node}", [Dtc(code, status) for code, status in dtcs], scanned_at)
+
+
+def test_append_counts_rows_and_keeps_last_duplicate():
+    with DtcStore(":memory:") as store:
+        written = store.append([
+            snapshot(VIN, "0C", [(0xD10000, PENDING), (0xD10000, CONFIRMED)], 100.0),
+            snapshot(VIN, "19", [], 100.0),
+            snapshot(OTHER_VIN, "0C", [(0xD20000, CONFIRMED)], 100.0),
+        ])
+        assert written == 3
+        assert store.history(VIN) == [("0C", 100.0, 0xD10000, CONFIRMED)]
+        # A second batch gets fresh scan IDs
+        store.append([snapshot(VIN, "0C", [(0xD20000, CONFIRMED)], 200.0)])
+        assert [row[:3] for row in store.history(VIN)] == [("0C", 200.0, 0xD20000), ("0C", 100.0, 0xD10000)]
+
+
+def test_vehicles_with_dtc_filters_status_and_time():
+    with DtcStore(":memory:") as store:
+        store.append([
+            snapshot(VIN, "0C", [(0xD10000, CONFIRMED)], 100.0),
+            snapshot(VIN, "0C", [(0xD10000, CONFIRMED)], 300.0),
+            snapshot(VIN, "19", [(0xD10000, PENDING)], 300.0),
+            snapshot(OTHER_VIN, "0C", [(0xD10000, CONFIRMED)], 500.0),
+            snapshot(OTHER_VIN, "19", [(0xD20000, CONFIRMED)], 300.0),
+        ])
+        assert store.vehicles_with_dtc("D10000") == [
+            (VIN, "0C", "ECU0C", 300.0, CONFIRMED),
+            (OTHER_VIN, "0C", "ECU0C", 500.0, CONFIRMED),
+        ]
+        assert store.vehicles_with_dtc(0xD10000, since=50, until=200) == [(VIN, "0C", "ECU0C", 100.0, CONFIRMED)]
+        assert store.vehicles_with_dtc("0xD10000", status_mask=STATUS_PENDING) == [
+            (VIN, "19", "ECU19", 300.0, PENDING)]
+        assert store.vehicles_with_dtc("D30000") == []
+
+
+def test_new_since_previous_scan():
+    with DtcStore(":memory:") as store:
+        store.append([snapshot(VIN, "0C", [(0xD10000, CONFIRMED)], 100.0)])
+        # The first scan of an ECU has nothing to compare with, so every DTC is new
+        assert store.new_since_previous_scan(VIN) == [(VIN, "0C", 0xD10000, CONFIRMED)]
+        store.append([
+            snapshot(VIN, "0C", [(0xD10000, CONFIRMED), (0xD20000, PENDING)], 200.0),
+            snapshot(OTHER_VIN, "0C", [(0xD30000, CONFIRMED)], 200.0),
+        ])
+        assert store.new_since_previous_scan(VIN) == [(VIN, "0C", 0xD20000, PENDING)]
+        assert store.new_since_previous_scan(node="0C") == [
+            (VIN, "0C", 0xD20000, PENDING),
+            (OTHER_VIN, "0C", 0xD30000, CONFIRMED),
+        ]
+
+
+def test_out_of_order_batch_keeps_latest_scan():
+    with DtcStore(":memory:") as store:
+        # Newest scan first in the batch: ecu_latest must still end on the 300 scan
+        store.append([
+            snapshot(VIN, "0C", [(0xD10000, CONFIRMED), (0xD20000, CONFIRMED)], 300.0),
+            snapshot(VIN, "0C", [(0xD10000, CONFIRMED)], 200.0),
+        ])
+        assert store.new_since_previous_scan(VIN, "0C") == [(VIN, "0C", 0xD20000, CONFIRMED)]
+        # A later batch holding only an older scan does not overtake it
+        store.append([snapshot(VIN, "0C", [(0xD30000, CONFIRMED)], 100.0)])
+        assert store.new_since_previous_scan(VIN, "0C") == [(VIN, "0C", 0xD20000, CONFIRMED)]
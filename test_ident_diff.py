@@ -0,0 +1,96 @@
+import asyncio
+
+from diag_session import read_identification
+from ecu_list import load_ecu_list
+from ident_diff import UNKNOWN_NODE, IdentReference, diff_batch, diff_stream
+
+VIN = "WAUZZZ4N0PN000001"
+
+ECU_LIST_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<root>
+    <ecu>
+        <Node>0C</Node>
+        <DoIP_ECU>400C</DoIP_ECU>
+        <us_en>Steering Column Electronics</us_en>
+        <ecu_master type="ident">
+            <values>
+                <ti_name>IDE00013</ti_name>
+                <display_value>Lenks.Modul </display_value>
+            </values>
+            <values>
+                <ti_name>IDE00007</ti_name>
+                <display_value>4N0907129AJ</display_value>
+            </values>
+            <values>
+                <ti_name>IDE00003</ti_name>
+                <display_value>01 0A 00 2F
+                    80 00</display_value>
+            </values>
+        </ecu_master>
+    </ecu>
+    <ecu>
+        <Node>19</Node>
+        <DoIP_ECU>4019</DoIP_ECU>
+        <us_en>Gateway</us_en>
+    </ecu>
+</root>
+"""
+
+
+def reference_for(tmp_path):
+    path = tmp_path / "ECU_List.xml"
+    path.write_text(ECU_LIST_XML, encoding="utf-8")
+    ecus = load_ecu_list(str(path))
+    return ecus, IdentReference(ecus)
+
+
+def fields(mismatches):
+    return [(m.vin, m.node, m.field, m.expected, m.actual) for m in mismatches]
+
+
+def test_none_is_never_a_mismatch(tmp_path):
+    _, reference = reference_for(tmp_path)
+    mismatches = diff_batch(
+        reference,
+        [VIN, VIN],
+        ["0C", "19"],
+        # 0C: IDE00007 not read; 19: no reference values at all
+        [{"IDE00013": "Lenks.Modul"}, {"IDE00007": "4N0907468B"}],
+    )
+    assert mismatches == []
+
+
+def test_whitespace_in_xml_values_is_normalised(tmp_path):
+    _, reference = reference_for(tmp_path)
+    ident = {"IDE00013": "Lenks.Modul", "IDE00003": "01 0A 00 2F 80 00"}
+    assert diff_batch(reference, [VIN], ["0C"], [ident]) == []
+
+
+def test_hex_coding_compared_as_read(tmp_path):
+    ecus, reference = reference_for(tmp_path)
+
+    class CodingTransport:
+        async def select_ecu(self, ecu):
+            pass
+
+        async def uds_request(self, payload, timeout_ms=3000):
+            if payload[1:3] == b"\x06\x00":
+                return bytes([0x62, 0x06, 0x00]) + bytes.fromhex("010a002f8001")
+            return bytes([0x7F, payload[0], 0x31])
+
+    ident = asyncio.run(read_identification(CodingTransport(), ecus[0]))
+    assert ident == {"IDE00003": "01 0A 00 2F 80 01"}
+    assert fields(diff_batch(reference, [VIN], ["0C"], [ident])) == [
+        (VIN, "0C", "IDE00003", "01 0A 00 2F 80 00", "01 0A 00 2F 80 01")]
+
+
+def test_unknown_node_is_reported(tmp_path):
+    _, reference = reference_for(tmp_path)
+    records = [
+        (VIN, "0C", {"IDE00007": "4N0907129AK"}),
+        (VIN, "7F", {"IDE00007": "4N0907129AJ"}),
+    ]
+    assert fields(diff_stream(reference, records, batch_size=1)) == [
+        (VIN, "0C", "IDE00007", "4N0907129AJ", "4N0907129AK"),
+        (VIN, "7F", UNKNOWN_NODE, None, "7F"),
+    ]
@@ -0,0 +1,115 @@
+import asyncio
+import random
+
+from response_matcher import ExpectationEngine, PatternAutomaton, ResponseFrameReassembler
+
+RECONFIG_DONE = bytes.fromhex("55 A9 00 01 FF 00")
+READ_RESPONSE = bytes.fromhex("55 A9 00 03 62 01 02 0F")
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_automaton_matches_like_brute_force():
+    rng = random.Random(1)
+    for _ in range(200):
+        patterns = sorted({bytes(rng.choice(b"\x55\xA9\x00\x01") for _ in range(rng.randint(1, 4)))
+                           for _ in range(rng.randint(1, 5))})
+        data = bytes(rng.choice(b"\x55\xA9\x00\x01") for _ in range(rng.randint(0, 40)))
+        automaton = PatternAutomaton(patterns)
+        # Feed in random chunks to exercise state carried across boundaries
+        state, found, pos = 0, set(), 0
+        while pos < len(data):
+            chunk = data[pos:pos + rng.randint(1, 5)]
+            state, matched = automaton.scan(state, chunk)
+            found.update((automaton.patterns[index], pos + offset) for index, offset in matched)
+            pos += len(chunk)
+        expected = {(p, end) for p in patterns for end in range(len(p), len(data) + 1)
+                    if data[end - len(p):end] == p}
+        assert found == expected
+
+
+def test_reassembler_joins_split_frames():
+    reassembler = ResponseFrameReassembler()
+    assert reassembler.feed(READ_RESPONSE[:3]) == []
+    assert reassembler.feed(READ_RESPONSE[3:] + RECONFIG_DONE[:1]) == [READ_RESPONSE]
+    assert reassembler.feed(RECONFIG_DONE[1:]) == [RECONFIG_DONE]
+
+
+def test_pattern_split_across_chunks():
+    async def scenario():
+        engine = ExpectationEngine()
+        ack = engine.expect(RECONFIG_DONE)
+        engine.feed(RECONFIG_DONE[:3])
+        assert not ack.done()
+        engine.feed(RECONFIG_DONE[3:])
+        return await engine.wait(ack, 100)
+
+    assert run(scenario()) == RECONFIG_DONE
+
+
+def test_pattern_started_before_expect_does_not_match():
+    async def scenario():
+        engine = ExpectationEngine()
+        engine.feed(RECONFIG_DONE[:-1])
+        ack = engine.expect(RECONFIG_DONE)
+        engine.feed(RECONFIG_DONE[-1:])
+        assert not ack.done()
+        engine.feed(RECONFIG_DONE)
+        return await engine.wait(ack, 100)
+
+    assert run(scenario()) == RECONFIG_DONE
+
+
+def test_new_pattern_keeps_partial_match_of_existing_waiter():
+    async def scenario():
+        engine = ExpectationEngine()
+        first = engine.expect(RECONFIG_DONE)
+        engine.feed(RECONFIG_DONE[:4])
+        # Registering another pattern recompiles the automaton mid-match
+        second = engine.expect(bytes.fromhex("55 A9 00 01 FE 00"))
+        engine.feed(RECONFIG_DONE[4:])
+        return first.done(), second.done()
+
+    assert run(scenario()) == (True, False)
+
+
+def test_frame_after_pattern_only_ack():
+    async def scenario():
+        engine = ExpectationEngine()
+        ack = engine.expect(bytes.fromhex("55 A9 03 01"))
+        engine.feed(bytes.fromhex("55 A9 03 01"))
+        assert await engine.wait(ack, 100) is not None
+        response = engine.expect_frame()
+        engine.feed(READ_RESPONSE)
+        return await engine.wait(response, 100)
+
+    assert run(scenario()) == READ_RESPONSE
+
+
+def test_frame_waiter_timeout_resyncs_reassembler():
+    async def scenario():
+        engine = ExpectationEngine()
+        response = engine.expect_frame()
+        # Looks like the header of a ~0x0301 byte frame that never completes
+        engine.feed(bytes.fromhex("55 A9 03 01"))
+        engine.feed(READ_RESPONSE)
+        assert await engine.wait(response, 50) is None
+        response = engine.expect_frame()
+        engine.feed(READ_RESPONSE)
+        return await engine.wait(response, 100)
+
+    assert run(scenario()) == READ_RESPONSE
+
+
+def test_frame_predicate_and_wait_any():
+    async def scenario():
+        engine = ExpectationEngine()
+        negative = engine.expect_frame(lambda frame: frame[4] == 0x7F)
+        positive = engine.expect_frame(lambda frame: frame[4] == 0x62)
+        engine.feed(READ_RESPONSE)
+        result = await engine.wait_any([negative, positive], 100)
+        return result, negative.cancelled()
+
+    assert run(scenario()) == (READ_RESPONSE, True)